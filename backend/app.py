@@ -8,14 +8,57 @@ import requests
 from flask import Flask, request, jsonify, send_file
 from werkzeug.utils import secure_filename
 import tempfile
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from flask import Response
+from grading import DEFAULT_TOLERANCE, as_bool, grade_answers, summarize_results
+from content_pool import CONSUMED_KINDS, ContentPool
+from sandbox import SandboxError, judge
+from chat_memory import ChatMemory
+from math_solver import cache_key as math_cache_key, solve_locally
+from shaping import OrjsonProvider, compress_response, echo_inputs, orjson
+from shared_state import get_state
 
 app = Flask(__name__)
+if orjson is not None:
+    app.json = OrjsonProvider(app)
+app.after_request(compress_response)
+
+# Sessions, challenge tests and rate-limit counters live here so several
+# workers / hosts see the same state (see shared_state.py)
+state = get_state()
+
+# Requests per client IP per minute, 0 = no limit
+RATE_LIMIT_PER_MINUTE = int(os.getenv("RATE_LIMIT_PER_MINUTE", "0"))
+
+
+def rate_limited(client_ip):
+    """Count this request in the shared per-minute counter, True if over the limit"""
+    if not RATE_LIMIT_PER_MINUTE:
+        return False
+    window = int(time.time() // 60)
+    return state.incr(f"rate:{client_ip}:{window}", ttl=60) > RATE_LIMIT_PER_MINUTE
+
+
+@app.before_request
+def check_rate_limit():
+    if rate_limited(request.remote_addr):
+        return jsonify({"error": "Too many requests"}), 429
 
-AI_BASE_URL = "http://127.0.0.1:8000"  # Where your AI APIs are running
+AI_BASE_URL = os.getenv("AI_BASE_URL", "http://127.0.0.1:8000")  # Where your AI APIs are running
 
 ALLOWED_PDF = {"pdf"}
 ALLOWED_AUDIO = {"mp3", "wav", "m4a"}
 
+# How many batch items are in flight at once when streaming NDJSON
+BATCH_STREAM_WORKERS = int(os.getenv("BATCH_STREAM_WORKERS", "4"))
+
+# /voice_script engine: "remote" (AI service) or "local" (offline /transcribe_local)
+VOICE_SCRIPT_ENGINE = os.getenv("VOICE_SCRIPT_ENGINE", "remote")
+# Use the local engine when the remote one fails (transcript only, index_name is not applied)
+VOICE_SCRIPT_LOCAL_FALLBACK = os.getenv("VOICE_SCRIPT_LOCAL_FALLBACK", "1") == "1"
+
 # ==========================
 # HELPERS
 # ==========================
@@ -33,11 +76,12 @@ def forward_post(endpoint: str, payload=None, files=None):
         return {"error": str(e)}, 500
 
 def wrap_response(inputs, ai_response):
-    """Standardized response structure"""
-    return {
-        "inputs_received": inputs,
-        "ai_response": ai_response
-    }
+    """Standardized response structure (inputs are only echoed if GATEWAY_ECHO_INPUTS is set)"""
+    response = {"ai_response": ai_response}
+    echo = echo_inputs(inputs)
+    if echo is not None:
+        response["inputs_received"] = echo
+    return response
 
 #-----------------------------------------------------------------------
 # File 1 : 
@@ -53,6 +97,59 @@ def require_fields(data, fields):
         return False, f"Missing required field(s): {', '.join(missing)}"
     return True, None
 
+# ----------------- Helpers for batch requests -----------------
+def wants_stream():
+    """True if the client asked for an NDJSON stream (?stream=1 or Accept: application/x-ndjson)"""
+    if request.args.get("stream", "").lower() in ("1", "true", "yes"):
+        return True
+    return "application/x-ndjson" in request.headers.get("Accept", "")
+
+
+def run_batch_item(item, fields, url):
+    """
+    Validate and forward one batch item, returns {id, response} or {id, error}.
+    Never raises, so one bad item can not cut the NDJSON stream short.
+    """
+    if not isinstance(item, dict):
+        return {"id": None, "error": "Batch item must be a JSON object"}
+
+    try:
+        valid, error = require_fields(item, fields)
+        if not valid:
+            return {"id": item.get("id"), "error": error}
+
+        payload = {field: item[field] for field in fields}
+        response = requests.post(url, json=payload)
+        if response.status_code != 200:
+            return {"id": item.get("id"), "error": response.text}
+        return {"id": item.get("id"), "response": response.json()}
+    except Exception as e:  # network errors, non-JSON bodies...
+        return {"id": item.get("id"), "error": str(e)}
+
+
+def stream_batch(items, fields, url):
+    """
+    Stream batch results as NDJSON, one line per item as soon as it completes.
+    At most BATCH_STREAM_WORKERS items are in flight, so memory stays flat
+    whatever the batch size. Lines come in completion order; use "id" to match.
+    """
+    def generate():
+        with ThreadPoolExecutor(max_workers=BATCH_STREAM_WORKERS) as pool:
+            pending = set()
+            for item in items:
+                if len(pending) >= BATCH_STREAM_WORKERS:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield json.dumps(future.result(), ensure_ascii=False) + "\n"
+                pending.add(pool.submit(run_batch_item, item, fields, url))
+
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield json.dumps(future.result(), ensure_ascii=False) + "\n"
+
+    return Response(generate(), mimetype="application/x-ndjson")
+
 # ----------------- 1) GET SCRIPT -----------------
 @app.route("/getting_script_from_video", methods=["POST"])
 def getting_script_from_video():
@@ -61,21 +158,9 @@ def getting_script_from_video():
 
         # Support batch requests
         if isinstance(data.get("requests"), list):
-            results = []
-            for item in data["requests"]:
-                valid, error = require_fields(item, ["input_link", "language"])
-                if not valid:
-                    results.append({"id": item.get("id"), "error": error})
-                    continue
-
-                payload = {"input_link": item["input_link"], "language": item["language"]}
-                response = requests.post("http://127.0.0.1:8000/getting_script", json=payload)
-
-                if response.status_code != 200:
-                    results.append({"id": item.get("id"), "error": response.text})
-                else:
-                    results.append({"id": item.get("id"), "response": response.json()})
-
+            if wants_stream():
+                return stream_batch(data["requests"], ["input_link", "language"], f"{AI_BASE_URL}/getting_script")
+            results = [run_batch_item(item, ["input_link", "language"], f"{AI_BASE_URL}/getting_script") for item in data["requests"]]
             return jsonify({"results": results})
 
         # Single request
@@ -84,7 +169,7 @@ def getting_script_from_video():
             return jsonify({"error": error}), 400
 
         payload = {"input_link": data["input_link"], "language": data["language"]}
-        response = requests.post("http://127.0.0.1:8000/getting_script", json=payload)
+        response = requests.post(f"{AI_BASE_URL}/getting_script", json=payload)
 
         if response.status_code != 200:
             return jsonify({"error": "Script API failed", "details": response.text}), response.status_code
@@ -102,21 +187,9 @@ def summarize():
         data = request.json or {}
 
         if isinstance(data.get("requests"), list):
-            results = []
-            for item in data["requests"]:
-                valid, error = require_fields(item, ["input_text"])
-                if not valid:
-                    results.append({"id": item.get("id"), "error": error})
-                    continue
-
-                payload = {"input_text": item["input_text"]}
-                response = requests.post("http://127.0.0.1:8000/summarize", json=payload)
-
-                if response.status_code != 200:
-                    results.append({"id": item.get("id"), "error": response.text})
-                else:
-                    results.append({"id": item.get("id"), "response": response.json()})
-
+            if wants_stream():
+                return stream_batch(data["requests"], ["input_text"], f"{AI_BASE_URL}/summarize")
+            results = [run_batch_item(item, ["input_text"], f"{AI_BASE_URL}/summarize") for item in data["requests"]]
             return jsonify({"results": results})
 
         valid, error = require_fields(data, ["input_text"])
@@ -124,7 +197,7 @@ def summarize():
             return jsonify({"error": error}), 400
 
         payload = {"input_text": data["input_text"]}
-        response = requests.post("http://127.0.0.1:8000/summarize", json=payload)
+        response = requests.post(f"{AI_BASE_URL}/summarize", json=payload)
 
         if response.status_code != 200:
             return jsonify({"error": "Summarize API failed", "details": response.text}), response.status_code
@@ -142,21 +215,9 @@ def chat():
         data = request.json or {}
 
         if isinstance(data.get("requests"), list):
-            results = []
-            for item in data["requests"]:
-                valid, error = require_fields(item, ["input_text", "question"])
-                if not valid:
-                    results.append({"id": item.get("id"), "error": error})
-                    continue
-
-                payload = {"input_text": item["input_text"], "question": item["question"]}
-                response = requests.post("http://127.0.0.1:8000/chat", json=payload)
-
-                if response.status_code != 200:
-                    results.append({"id": item.get("id"), "error": response.text})
-                else:
-                    results.append({"id": item.get("id"), "response": response.json()})
-
+            if wants_stream():
+                return stream_batch(data["requests"], ["input_text", "question"], f"{AI_BASE_URL}/chat")
+            results = [run_batch_item(item, ["input_text", "question"], f"{AI_BASE_URL}/chat") for item in data["requests"]]
             return jsonify({"results": results})
 
         valid, error = require_fields(data, ["input_text", "question"])
@@ -164,7 +225,7 @@ def chat():
             return jsonify({"error": error}), 400
 
         payload = {"input_text": data["input_text"], "question": data["question"]}
-        response = requests.post("http://127.0.0.1:8000/chat", json=payload)
+        response = requests.post(f"{AI_BASE_URL}/chat", json=payload)
 
         if response.status_code != 200:
             return jsonify({"error": "Chat API failed", "details": response.text}), response.status_code
@@ -182,21 +243,9 @@ def extract_main_points():
         data = request.json or {}
 
         if isinstance(data.get("requests"), list):
-            results = []
-            for item in data["requests"]:
-                valid, error = require_fields(item, ["input_text"])
-                if not valid:
-                    results.append({"id": item.get("id"), "error": error})
-                    continue
-
-                payload = {"input_text": item["input_text"]}
-                response = requests.post("http://127.0.0.1:8000/extract_main_points", json=payload)
-
-                if response.status_code != 200:
-                    results.append({"id": item.get("id"), "error": response.text})
-                else:
-                    results.append({"id": item.get("id"), "response": response.json()})
-
+            if wants_stream():
+                return stream_batch(data["requests"], ["input_text"], f"{AI_BASE_URL}/extract_main_points")
+            results = [run_batch_item(item, ["input_text"], f"{AI_BASE_URL}/extract_main_points") for item in data["requests"]]
             return jsonify({"results": results})
 
         valid, error = require_fields(data, ["input_text"])
@@ -204,7 +253,7 @@ def extract_main_points():
             return jsonify({"error": error}), 400
 
         payload = {"input_text": data["input_text"]}
-        response = requests.post("http://127.0.0.1:8000/extract_main_points", json=payload)
+        response = requests.post(f"{AI_BASE_URL}/extract_main_points", json=payload)
 
         if response.status_code != 200:
             return jsonify({"error": "Extract API failed", "details": response.text}), response.status_code
@@ -342,6 +391,9 @@ def backend_upload_pdf_file3():
         # ✅ Prepare request for AI API (form-data)
         files = {"file": (file.filename, file_bytes, file.mimetype)}
         data = {"index_name": index_name}
+        # Only used when the index is created: flat, sq16, sq8, ivf or pq
+        if request.form.get("index_type"):
+            data["index_type"] = request.form["index_type"]
 
         # print(f"[file3] Forwarding → file={file.filename}, index_name={index_name}")
 
@@ -385,9 +437,66 @@ def backend_evaluation_file3():
     if not (len(data.get("questions", [])) == len(data.get("student_answers", [])) == len(data.get("correct_answers", []))):
         return jsonify({"error": "Questions, student_answers, and correct_answers must have same length"}), 400
 
-    ai_resp = forward_post("/evaluation", payload=data)
+    questions = data.get("questions", [])
+    student_answers = data.get("student_answers", [])
+    correct_answers = data.get("correct_answers", [])
+
+    # MCQ / true-false / numeric / exact answers are graded here,
+    # only free-text answers go to the LLM (in one request)
+    try:
+        results, pending = grade_answers(
+            student_answers, correct_answers,
+            data.get("answer_types"), data.get("tolerance", DEFAULT_TOLERANCE)
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    llm_resp = None
+    if pending:
+        payload = {k: v for k, v in data.items() if k not in ("answer_types", "tolerance")}
+        payload["questions"] = [questions[i] for i in pending]
+        payload["student_answers"] = [student_answers[i] for i in pending]
+        payload["correct_answers"] = [correct_answers[i] for i in pending]
+        llm_resp = forward_post("/evaluation", payload=payload)
+
+    for i, result in enumerate(results):
+        result["index"] = i
+        result["question"] = questions[i]
+
+    ai_resp = {
+        "results": results,
+        **summarize_results(results),
+        "llm_indexes": pending,  # order of the items in llm_evaluation
+        "llm_evaluation": llm_resp,
+    }
     return jsonify(wrap_response(data, ai_resp))
 
+def transcribe_local(file_bytes, filename, language=None):
+    """Send raw audio to the offline transcription engine of the AI service"""
+    params = {"filename": filename}
+    if language:
+        params["language"] = language
+    response = requests.post(
+        f"{AI_BASE_URL}/transcribe_local",
+        data=file_bytes,
+        params=params,
+        headers={"Content-Type": "application/octet-stream"},
+        timeout=600
+    )
+    response.raise_for_status()
+    return response.json()
+
+
+def local_transcript_response(ai_resp, index_name, reason):
+    """The local engine only transcribes: say that index_name was not applied"""
+    if isinstance(ai_resp, dict):
+        ai_resp = {
+            **ai_resp,
+            "index_name_applied": False,
+            "warning": f"Transcribed locally ({reason}), nothing was added to index '{index_name}'",
+        }
+    return ai_resp
+
 @app.route("/backend/voice_script", methods=["POST"])
 def backend_voice_script_file3():
     if "file" not in request.files or "index_name" not in request.form:
@@ -408,33 +517,89 @@ def backend_voice_script_file3():
     files = {"file": (filename, file_bytes, "audio/mpeg")}
     data = {"index_name": index_name}
 
-    try:
-        # ✅ Call AI API correctly (files + form-data, not JSON)
-        response = requests.post(
-            f"{AI_BASE_URL}/voice_script",
-            files=files,
-            data=data,
-            timeout=120
-        )
-        response.raise_for_status()
+    engine = request.form.get("engine", VOICE_SCRIPT_ENGINE)
 
-        ai_resp = response.json()
+    try:
+        if engine == "local":
+            ai_resp = transcribe_local(file_bytes, filename, request.form.get("language"))
+            ai_resp = local_transcript_response(ai_resp, index_name, "engine=local")
+        else:
+            # ✅ Call AI API correctly (files + form-data, not JSON)
+            response = requests.post(
+                f"{AI_BASE_URL}/voice_script",
+                files=files,
+                data=data,
+                timeout=120
+            )
+            response.raise_for_status()
+
+            ai_resp = response.json()
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
+        if engine == "local" or not VOICE_SCRIPT_LOCAL_FALLBACK:
+            return jsonify({"error": str(e)}), 500
+        try:
+            ai_resp = transcribe_local(file_bytes, filename, request.form.get("language"))
+        except Exception as local_error:
+            return jsonify({"error": str(e), "local_error": str(local_error)}), 500
+        ai_resp = local_transcript_response(ai_resp, index_name, f"voice_script failed: {e}")
 
     return jsonify(wrap_response(
         {"index_name": index_name, "file_name": filename},
         ai_resp
     ))
 
+# Answers are cached per normalised question (see math_solver.py)
+MATH_CACHE_TTL = int(os.getenv("MATH_CACHE_TTL", str(30 * 24 * 3600)))
+# Answer recognisable questions with the local solver, the AI service only explains
+# or takes what the solver does not recognise. "0" sends every question to the AI service.
+MATH_LOCAL_ANSWERS = os.getenv("MATH_LOCAL_ANSWERS", "1") == "1"
+
+
+def math_response(local):
+    """Local solution in the AI service's response shape (no plot for local answers)"""
+    return {**local, "drawing_code": None}
+
+
+def local_math_answer(data):
+    """
+    Cached or locally solved answer for a math_physics request.
+    Returns (cache_key, answer), answer is None when the AI service is needed
+    ("explain" in the request, or a question the local solver does not recognise).
+    """
+    question = data["input_Q"]
+    explain = as_bool(data.get("explain", "")) is True
+    key = math_cache_key(question, "explain" if explain else "answer")
+    cached = state.get_json(key)
+    if cached is not None:
+        return key, cached
+    if explain or not MATH_LOCAL_ANSWERS:
+        return key, None
+
+    local = solve_locally(question)
+    if local is None:
+        return key, None
+    answer = math_response(local)
+    state.set_json(key, answer, ttl=MATH_CACHE_TTL)
+    return key, answer
+
+
+def store_math_answer(key, ai_resp):
+    """Cache an AI service answer"""
+    if isinstance(ai_resp, dict) and "error" not in ai_resp:
+        state.set_json(key, ai_resp, ttl=MATH_CACHE_TTL)
+    return ai_resp
+
+
 @app.route("/backend/file3/math_physics", methods=["POST"])
 def backend_math_physics_file3():
     data = request.json or {}
     if not data.get("input_Q"):
         return jsonify({"error": "input_Q is required"}), 400
 
-    ai_resp = forward_post("/math&physics", payload=data)
-    return jsonify(wrap_response(data, ai_resp))
+    key, answer = local_math_answer(data)
+    if answer is None:
+        answer = store_math_answer(key, forward_post("/math&physics", payload=data))
+    return jsonify(wrap_response(data, answer))
 
 
 # ==========================
@@ -501,6 +666,7 @@ from datetime import datetime
 
 
 SESSIONS_FILE = "sessions.json"
+# Legacy file, only read for sessions created before the shared state backend
 
 # -----------------------------
 # JSON Storage Helpers
@@ -521,14 +687,20 @@ def save_sessions(data):
 
 
 def get_session(session_id):
-    sessions = load_sessions()
-    return sessions.get(session_id)
+    session = state.get_json(f"session:{session_id}")
+    if session is None:
+        # Sessions created before the shared state backend
+        session = load_sessions().get(session_id)
+    return session
 
 
 def save_session(session_data):
-    sessions = load_sessions()
-    sessions[session_data["session_id"]] = session_data
-    save_sessions(sessions)
+    state.set_json(f"session:{session_data['session_id']}", session_data)
+
+
+def session_lock(session_id):
+    """Guards read-modify-write of a session across workers (request threads + chat summariser)"""
+    return state.lock(f"session:{session_id}")
 
 
 # -----------------------------
@@ -553,7 +725,82 @@ def forward_post(endpoint: str, payload: dict):
 
 
 def wrap_response(input_data, ai_response):
-    return {"input": input_data, "ai_output": ai_response}
+    response = {"ai_output": ai_response}
+    echo = echo_inputs(input_data)
+    if echo is not None:
+        response["input"] = echo
+    return response
+
+
+def summarize_chat(text):
+    ai_resp = forward_post("/summarize", {"input_text": text})
+    if isinstance(ai_resp, dict):
+        return ai_resp.get("summary")
+    return None
+
+
+chat_memory = ChatMemory(get_session, save_session, summarize_chat, session_lock)
+
+
+# -----------------------------
+# Lesson / quiz pool
+# -----------------------------
+POOL_ENDPOINTS = {"lesson": "/lesson/{lesson}", "quiz": "/generate-quiz/{lesson}"}
+# Every (language, lesson) gets its own pool, so both are bounded: a language from the
+# query string must be listed here (or in CONTENT_POOL_PREFILL), session languages are trusted
+POOL_LANGUAGES = set(filter(None, os.getenv("CONTENT_POOL_LANGUAGES", "en,ar").split(",")))
+MAX_LESSON_NUMBER = int(os.getenv("MAX_LESSON_NUMBER", "100"))
+
+
+def fetch_pool_content(kind, language, lesson):
+    """Generate one lesson body / quiz variant with the AI service (None on error)"""
+    ai_resp = forward_get(POOL_ENDPOINTS[kind].format(lesson=lesson), {"language": language})
+    if not isinstance(ai_resp, dict) or "error" in ai_resp:
+        return None
+    return ai_resp
+
+
+content_pool = ContentPool(fetch_pool_content)
+
+# Pre-generate at startup, e.g. CONTENT_POOL_PREFILL="en:1-10,ar:1-10"
+for spec in filter(None, os.getenv("CONTENT_POOL_PREFILL", "").split(",")):
+    pool_language, lesson_range = spec.split(":")
+    POOL_LANGUAGES.add(pool_language)
+    first, _, last = lesson_range.partition("-")
+    for pool_kind in POOL_ENDPOINTS:
+        content_pool.prefill(pool_kind, pool_language, range(int(first), int(last or first) + 1))
+
+
+def pooled_content(kind, language, lesson_number):
+    """
+    Serve a lesson / quiz from the local pool with ETag support.
+    Falls back to generating it live on a pool miss.
+    """
+    inputs = {"lesson_number": lesson_number}
+    if not 1 <= lesson_number <= MAX_LESSON_NUMBER:
+        return jsonify({"error": f"lesson_number must be between 1 and {MAX_LESSON_NUMBER}"}), 400
+    etag = request.headers.get("If-None-Match")
+    if etag and content_pool.has_etag(kind, language, lesson_number, etag):
+        response = Response(status=304)
+        response.headers["ETag"] = f'"{etag.strip(chr(34))}"'
+        return response
+
+    entry = content_pool.get(kind, language, lesson_number)
+    if entry is None:
+        ai_resp = forward_get(POOL_ENDPOINTS[kind].format(lesson=lesson_number), {"language": language})
+        if not isinstance(ai_resp, dict) or "error" in ai_resp:
+            return jsonify(wrap_response(inputs, ai_resp))
+        # Keep it for next time (quizzes are single use, so only lessons)
+        if kind in CONSUMED_KINDS:
+            entry = {"etag": None, "body": ai_resp}
+        else:
+            entry = content_pool.add(kind, language, lesson_number, ai_resp)
+        content_pool.refill(kind, language, lesson_number)
+
+    response = jsonify(wrap_response(inputs, entry["body"]))
+    if entry["etag"]:
+        response.headers["ETag"] = f'"{entry["etag"]}"'
+    return response
 
 # ---------------------------
 # Backend Routes
@@ -595,9 +842,7 @@ def backend_get_lesson(lesson_number):
     if not session:
         return jsonify({"error": "Session not found"}), 404
 
-    ai_resp = forward_get(f"/lesson/{lesson_number}")
-
-    return jsonify(wrap_response({"lesson_number": lesson_number}, ai_resp))
+    return pooled_content("lesson", session.get("language", "default"), lesson_number)
 
 
 @app.route("/backend/ask-tutor", methods=["POST"])
@@ -611,23 +856,34 @@ def backend_ask_tutor():
     if not session:
         return jsonify({"error": "Session not found"}), 404
 
-    ai_resp = forward_post("/ask-tutor", {"question": data["question"]})
+    # Bounded context: rolling summary + recent turns within a token budget
+    ai_resp = forward_post("/ask-tutor", {
+        "question": data["question"],
+        "context": chat_memory.build_context(session)
+    })
 
     # update chat history
     if isinstance(ai_resp, dict) and "response" in ai_resp:
-        session["chat_history"].append({
-            "user": data["question"],
-            "assistant": ai_resp["response"],
-            "timestamp": datetime.now().isoformat()
-        })
-        save_session(session)
+        with session_lock(session_id):
+            session = get_session(session_id) or session
+            chat_memory.add_turn(session, {
+                "user": data["question"],
+                "assistant": ai_resp["response"],
+                "timestamp": datetime.now().isoformat()
+            })
+            save_session(session)
 
     return jsonify(wrap_response(data, ai_resp))
 
 @app.route("/backend/generate-quiz/<int:lesson_number>", methods=["GET"])
 def backend_generate_quiz(lesson_number):
-    ai_resp = forward_get(f"/generate-quiz/{lesson_number}")
-    return jsonify(wrap_response({"lesson_number": lesson_number}, ai_resp))
+    language = request.args.get("language")
+    if language and language not in POOL_LANGUAGES:
+        return jsonify({"error": f"Unsupported language: {language}"}), 400
+    if not language and request.args.get("session_id"):
+        session = get_session(request.args["session_id"]) or {}
+        language = session.get("language")
+    return pooled_content("quiz", language or "default", lesson_number)
 
 @app.route("/backend/submit-quiz", methods=["POST"])
 def backend_submit_quiz():
@@ -639,6 +895,31 @@ def backend_submit_quiz():
     if not isinstance(data.get("answers"), list):
         return jsonify({"error": "answers must be a list"}), 400
 
+    answers = data["answers"]
+
+    # Answers that carry their key ({"answer", "correct_answer"}) are graded locally
+    if answers and all(isinstance(a, dict) and "correct_answer" in a for a in answers):
+        try:
+            results, pending = grade_answers(
+                [a.get("answer") for a in answers],
+                [a["correct_answer"] for a in answers],
+                [a.get("type") for a in answers],
+                data.get("tolerance", DEFAULT_TOLERANCE)
+            )
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        llm_resp = None
+        if pending:
+            llm_resp = forward_post("/submit-quiz", payload={**data, "answers": [answers[i] for i in pending]})
+
+        ai_resp = {
+            "results": results,
+            **summarize_results(results),
+            "llm_indexes": pending,
+            "llm_evaluation": llm_resp,
+        }
+        return jsonify(wrap_response(data, ai_resp))
+
     ai_resp = forward_post("/submit-quiz", payload=data)
     return jsonify(wrap_response(data, ai_resp))
 
@@ -658,7 +939,7 @@ def backend_available_languages():
 import requests
 
 def forward_gets(endpoint):
-    url = f"http://127.0.0.1:8000{endpoint}"
+    url = f"{AI_BASE_URL}{endpoint}"
     try:
         resp = requests.get(url)
         resp.raise_for_status()
@@ -673,7 +954,7 @@ def forward_gets(endpoint):
         return {"error": str(e)}
 
 def forward_posts(endpoint, payload):
-    url = f"http://127.0.0.1:8000{endpoint}"
+    url = f"{AI_BASE_URL}{endpoint}"
     try:
         resp = requests.post(url, json=payload)
         resp.raise_for_status()
@@ -687,9 +968,28 @@ def forward_posts(endpoint, payload):
         return {"error": str(e)}
 
 
+# -----------------------------
+# Coding challenge test cases (for the local judge)
+# -----------------------------
+CHALLENGE_TTL = 7 * 24 * 3600
+
+
+def save_challenge_tests(challenge_id, test_cases):
+    state.set_json(f"challenge:{challenge_id}", test_cases, ttl=CHALLENGE_TTL)
+
+
+def get_challenge_tests(challenge_id):
+    return state.get_json(f"challenge:{challenge_id}")
+
+
 @app.route("/backend/generate-coding-challenge", methods=["GET"])
 def backend_generate_coding_challenge():
     ai_resp = forward_gets("/generate-coding-challenge")
+
+    # Remember the test cases so /submit-code can judge locally
+    if isinstance(ai_resp, dict) and ai_resp.get("challenge_id") and isinstance(ai_resp.get("test_cases"), list):
+        save_challenge_tests(ai_resp["challenge_id"], ai_resp["test_cases"])
+
     return jsonify(wrap_response({}, ai_resp))
 
 
@@ -702,7 +1002,24 @@ def backend_submit_code():
     if not data.get("code"):
         return jsonify({"error": "code is required"}), 400
 
-    ai_resp = forward_posts("/submit-code", payload=data)
+    # Run the tests locally, the AI service only gives qualitative feedback.
+    # Only test cases stored by generate-coding-challenge count, never ones from the request.
+    test_cases = get_challenge_tests(data["challenge_id"])
+    payload = {k: v for k, v in data.items() if k != "judge_results"}
+    if isinstance(test_cases, list) and test_cases:
+        try:
+            judge_result = judge.judge(data["code"], test_cases)
+            payload["judge_results"] = judge_result
+        except SandboxError as e:
+            # Never run user code unconfined, the AI service reviews it alone
+            print(f"Local judge unavailable: {e}")
+            judge_result = {"error": str(e)}
+    else:
+        judge_result = {"error": "no stored tests"}
+
+    ai_resp = forward_posts("/submit-code", payload=payload)
+    if isinstance(ai_resp, dict):
+        ai_resp["judge"] = judge_result
     return jsonify(wrap_response(data, ai_resp))
 
 
@@ -0,0 +1,35 @@
+"""
+GZipMiddleware for the ASGI apps (main.py, async_app.py) that leaves
+NDJSON streams uncompressed.
+
+Starlette's GZipMiddleware compresses streaming responses too, and the
+gzip stream holds partial results back until enough bytes pile up (in
+practice until the end), so clients sending Accept-Encoding: gzip (the
+default for requests, httpx and browsers) saw no progress.
+"""
+from starlette.datastructures import Headers
+from starlette.middleware import gzip
+
+STREAM_CONTENT_TYPES = ("application/x-ndjson", "text/event-stream")
+
+
+class _GZipResponder(gzip.GZipResponder):
+    async def send_with_compression(self, message):
+        if message["type"] == "http.response.start":
+            content_type = Headers(raw=message["headers"]).get("content-type", "")
+            await super().send_with_compression(message)
+            # Passed through untouched, like the event streams Starlette already skips
+            self.content_type_is_excluded = self.content_type_is_excluded or content_type.startswith(
+                STREAM_CONTENT_TYPES
+            )
+            return
+        await super().send_with_compression(message)
+
+
+class GZipMiddleware(gzip.GZipMiddleware):
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and "gzip" in Headers(scope=scope).get("Accept-Encoding", ""):
+            responder = _GZipResponder(self.app, self.minimum_size, compresslevel=self.compresslevel)
+            await responder(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
@@ -0,0 +1,131 @@
+"""
+Bounded conversation memory for ask-tutor sessions.
+
+A session keeps only the last CHAT_WINDOW_TURNS turns in "chat_history".
+Older turns are moved to "summary_queue" and folded into a rolling
+"summary" by a background thread (one /summarize call per batch), so the
+request path never waits for it. build_context() packs the summary and
+the most recent turns into a token budget for the prompt.
+"""
+import os
+import queue
+import threading
+
+CHAT_WINDOW_TURNS = int(os.getenv("CHAT_WINDOW_TURNS", "8"))
+CHAT_CONTEXT_TOKENS = int(os.getenv("CHAT_CONTEXT_TOKENS", "1500"))
+SUMMARY_MAX_CHARS = int(os.getenv("CHAT_SUMMARY_MAX_CHARS", "2000"))
+# Turns waiting for the summariser; the oldest are dropped beyond this (e.g. /summarize keeps failing)
+SUMMARY_QUEUE_MAX_TURNS = int(os.getenv("CHAT_SUMMARY_QUEUE_MAX_TURNS", str(4 * CHAT_WINDOW_TURNS)))
+
+
+def estimate_tokens(text):
+    """Rough token count (~4 characters per token)"""
+    return len(text) // 4 + 1
+
+
+def format_turn(turn):
+    return f"Student: {turn['user']}\nTutor: {turn['assistant']}"
+
+
+class ChatMemory:
+    def __init__(self, get_session, save_session, summarize, lock):
+        """
+        get_session(session_id) / save_session(session) read and write sessions,
+        summarize(text) -> str or None, lock(session_id) -> context manager that
+        guards read-modify-write of one session (shared by all workers).
+        """
+        self.get_session = get_session
+        self.save_session = save_session
+        self.summarize = summarize
+        self.lock = lock
+        self._queue = queue.Queue()
+        self._queued = set()
+        self._queued_lock = threading.Lock()
+        self._worker = None
+
+    def add_turn(self, session, turn):
+        """Append a turn, moving overflow out of the window (caller holds the lock and saves)"""
+        history = session.setdefault("chat_history", [])
+        history.append(turn)
+        if len(history) > CHAT_WINDOW_TURNS:
+            overflow = history[:-CHAT_WINDOW_TURNS]
+            session["chat_history"] = history[-CHAT_WINDOW_TURNS:]
+            pending = session.setdefault("summary_queue", [])
+            pending.extend(overflow)
+            dropped = len(pending) - SUMMARY_QUEUE_MAX_TURNS
+            if dropped > 0:
+                del pending[:dropped]
+                # Position of the first queued turn, so an in-flight summary removes the right ones
+                session["summary_queue_start"] = session.get("summary_queue_start", 0) + dropped
+                session["dropped_turns"] = session.get("dropped_turns", 0) + dropped
+            self._schedule(session["session_id"])
+
+    def build_context(self, session, budget=CHAT_CONTEXT_TOKENS):
+        """Summary of older turns + as many recent turns as fit in the token budget"""
+        parts = []
+        summary = session.get("summary")
+        if summary:
+            parts.append(f"Summary of the earlier conversation:\n{summary}")
+            budget -= estimate_tokens(parts[0])
+
+        recent = []
+        for turn in reversed(session.get("chat_history", [])):
+            text = format_turn(turn)
+            cost = estimate_tokens(text)
+            if cost > budget:
+                break
+            recent.append(text)
+            budget -= cost
+
+        parts.extend(reversed(recent))
+        return "\n\n".join(parts)
+
+    # -----------------------------
+    # Background summarisation
+    # -----------------------------
+    def _schedule(self, session_id):
+        with self._queued_lock:
+            if session_id in self._queued:
+                return
+            self._queued.add(session_id)
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, daemon=True)
+                self._worker.start()
+        self._queue.put(session_id)
+
+    def _run(self):
+        while True:
+            session_id = self._queue.get()
+            with self._queued_lock:
+                self._queued.discard(session_id)
+            try:
+                self._summarize_session(session_id)
+            except Exception as e:
+                print(f"Chat summary error for session {session_id}: {e}")
+
+    def _summarize_session(self, session_id):
+        with self.lock(session_id):
+            session = self.get_session(session_id)
+            if not session or not session.get("summary_queue"):
+                return
+            turns = list(session["summary_queue"])
+            end = session.get("summary_queue_start", 0) + len(turns)
+            previous = session.get("summary", "")
+
+        text = "\n\n".join(format_turn(turn) for turn in turns)
+        if previous:
+            text = f"{previous}\n\n{text}"
+        summary = self.summarize(text)
+        if not summary:
+            return  # keep the queue, retried on the next overflow
+
+        with self.lock(session_id):
+            session = self.get_session(session_id)
+            if not session:
+                return
+            start = session.get("summary_queue_start", 0)
+            session["summary"] = summary[:SUMMARY_MAX_CHARS]
+            session["summary_queue"] = session.get("summary_queue", [])[max(0, end - start):]
+            session["summary_queue_start"] = max(start, end)
+            session["summarized_turns"] = session.get("summarized_turns", 0) + len(turns)
+            self.save_session(session)
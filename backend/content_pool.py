@@ -0,0 +1,173 @@
+"""
+Pre-generated lesson / quiz pool.
+
+Lessons are a fixed numbered sequence per language, so instead of asking
+the AI service on every GET we keep a few ready variants per
+(kind, language, lesson) on disk and serve them locally.
+
+- lessons: LESSON_POOL_SIZE bodies, served as-is (not consumed)
+- quizzes: QUIZ_POOL_SIZE variants, each served once then moved to used/
+
+A background thread refills a key as soon as it is running low.
+Every stored variant has an ETag so clients can revalidate with If-None-Match.
+
+Layout: <CONTENT_POOL_DIR>/<language>/<kind>/<lesson>/{ready,used}/<etag>.json
+"""
+import hashlib
+import json
+import os
+import queue
+import re
+import threading
+import time
+
+CONTENT_POOL_DIR = os.getenv("CONTENT_POOL_DIR", "content_pool")
+QUIZ_POOL_SIZE = int(os.getenv("QUIZ_POOL_SIZE", "5"))
+LESSON_POOL_SIZE = int(os.getenv("LESSON_POOL_SIZE", "1"))
+# Used quizzes kept per key (for If-None-Match on already served quizzes)
+USED_KEEP = int(os.getenv("CONTENT_POOL_USED_KEEP", "20"))
+
+POOL_SIZES = {"lesson": LESSON_POOL_SIZE, "quiz": QUIZ_POOL_SIZE}
+CONSUMED_KINDS = {"quiz"}
+
+
+def make_etag(body):
+    raw = json.dumps(body, sort_keys=True, ensure_ascii=False).encode("utf-8")
+    return hashlib.sha1(raw).hexdigest()
+
+
+class ContentPool:
+    def __init__(self, fetch, root=CONTENT_POOL_DIR):
+        """fetch(kind, language, lesson) -> body dict, or None if generation failed"""
+        self.fetch = fetch
+        self.root = root
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._queued = set()
+        self._worker = None
+
+    # -----------------------------
+    # Storage
+    # -----------------------------
+    def _dir(self, kind, language, lesson, state):
+        language = re.sub(r"[^\w\-]", "_", str(language))  # comes from the client
+        return os.path.join(self.root, language, kind, str(int(lesson)), state)
+
+    def _list(self, kind, language, lesson, state):
+        folder = self._dir(kind, language, lesson, state)
+        if not os.path.isdir(folder):
+            return []
+        files = [os.path.join(folder, name) for name in os.listdir(folder) if name.endswith(".json")]
+        return sorted(files, key=self._mtime)
+
+    @staticmethod
+    def _mtime(path):
+        try:
+            return os.path.getmtime(path)
+        except FileNotFoundError:
+            return 0  # just taken by another worker, skipped when read
+
+    def _read(self, path):
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def add(self, kind, language, lesson, body):
+        """Store a generated variant, returns the stored entry"""
+        entry = {"etag": make_etag(body), "body": body, "created_at": time.time()}
+        folder = self._dir(kind, language, lesson, "ready")
+        os.makedirs(folder, exist_ok=True)
+        path = os.path.join(folder, f"{entry['etag']}.json")
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(path + ".tmp", path)
+        return entry
+
+    def count(self, kind, language, lesson):
+        return len(self._list(kind, language, lesson, "ready"))
+
+    def has_etag(self, kind, language, lesson, etag):
+        """True if etag is a variant of this key we have served or can serve"""
+        etag = etag.strip('"')
+        if not re.fullmatch(r"[0-9a-f]{40}", etag):
+            return False
+        return any(
+            os.path.exists(os.path.join(self._dir(kind, language, lesson, state), f"{etag}.json"))
+            for state in ("ready", "used")
+        )
+
+    # -----------------------------
+    # Serving
+    # -----------------------------
+    def get(self, kind, language, lesson):
+        """
+        Return a ready entry, or None on a pool miss. Schedules a refill check on a hit;
+        on a miss the caller refills after its live fetch, so the lesson is not generated twice.
+        """
+        entry = None
+        with self._lock:
+            # _lock is per process: another worker may take (or move) a file first
+            for path in self._list(kind, language, lesson, "ready"):
+                try:
+                    if kind in CONSUMED_KINDS:
+                        path = self._mark_used(kind, language, lesson, path)
+                    entry = self._read(path)
+                    break
+                except FileNotFoundError:
+                    continue
+
+        if entry is not None:
+            self.refill(kind, language, lesson)
+        return entry
+
+    def _mark_used(self, kind, language, lesson, path):
+        """Move a ready file to used/ (atomic, so only one worker gets it), returns the new path"""
+        used_dir = self._dir(kind, language, lesson, "used")
+        os.makedirs(used_dir, exist_ok=True)
+        used_path = os.path.join(used_dir, os.path.basename(path))
+        os.replace(path, used_path)
+        for old in self._list(kind, language, lesson, "used")[:-USED_KEEP]:
+            if old == used_path:
+                continue
+            try:
+                os.remove(old)
+            except FileNotFoundError:
+                pass
+        return used_path
+
+    # -----------------------------
+    # Background refill
+    # -----------------------------
+    def refill(self, kind, language, lesson):
+        """Queue (kind, language, lesson) for generation if it is below its pool size"""
+        key = (kind, language, lesson)
+        if self.count(*key) >= POOL_SIZES.get(kind, 1):
+            return
+        with self._lock:
+            if key in self._queued:
+                return
+            self._queued.add(key)
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, daemon=True)
+                self._worker.start()
+        self._queue.put(key)
+
+    def prefill(self, kind, language, lessons):
+        for lesson in lessons:
+            self.refill(kind, language, lesson)
+
+    def _run(self):
+        while True:
+            key = self._queue.get()
+            try:
+                # Bounded: a generator that returns the same body twice must not loop forever
+                missing = POOL_SIZES.get(key[0], 1) - self.count(*key)
+                for _ in range(missing):
+                    body = self.fetch(*key)
+                    if body is None:
+                        break
+                    self.add(*key, body)
+            except Exception as e:
+                print(f"Content pool refill error for {key}: {e}")
+            finally:
+                with self._lock:
+                    self._queued.discard(key)
@@ -0,0 +1,195 @@
+"""
+Local fast-path grading for /evaluation and /submit-quiz.
+
+Multiple choice, true/false, numeric (with tolerance when answer_types
+says "numeric", exact otherwise) and exact-match answers are graded here in one pass over the answer lists. Only the
+free-text answers that need judgement are left for the LLM, which the
+caller sends in a single batched request.
+"""
+import math
+import re
+import unicodedata
+from fractions import Fraction
+
+# Relative tolerance for answers marked "numeric" in answer_types (1%)
+DEFAULT_TOLERANCE = 0.01
+
+TRUE_WORDS = {"true", "t", "yes", "y", "correct", "صح", "صحيح", "نعم"}
+FALSE_WORDS = {"false", "f", "no", "n", "incorrect", "wrong", "خطأ", "خطا", "خاطئ", "لا"}
+
+# A letter on its own, "(b)", or followed by ")", "." or ":" ("A lot", "I think..." are not options)
+_OPTION_RE = re.compile(r"^(?:([a-z])$|\(([a-z])\)(?:\s|$)|([a-z])[).:](?:\s|$))", re.IGNORECASE)
+_NUMBER = r"[-+]?(?:\d+(?:\.\d*)?|\.\d+)(?:e[-+]?\d+)?"
+_NUMBER_RE = re.compile(rf"^({_NUMBER})$")
+_FRACTION_RE = re.compile(rf"^({_NUMBER})/({_NUMBER})$")
+_POWER_RE = re.compile(rf"^({_NUMBER})(?:\^|\*\*)({_NUMBER})$")
+_SCIENTIFIC_RE = re.compile(rf"^({_NUMBER})(?:\*|x|×)10(?:\^|\*\*)({_NUMBER})$")
+_ARABIC_DIGITS = str.maketrans("٠١٢٣٤٥٦٧٨٩", "0123456789")
+MAX_POWER = 308
+
+
+def normalize(text):
+    """Lowercase, strip accents/diacritics, punctuation and extra spaces"""
+    text = unicodedata.normalize("NFKD", str(text)).translate(_ARABIC_DIGITS)
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    text = re.sub(r"[^\w\s.\-+]", " ", text.lower())
+    # Only trailing dots: ".1" keeps its leading one
+    return " ".join(text.split()).rstrip(" .")
+
+
+def as_bool(text):
+    word = normalize(text)
+    if word in TRUE_WORDS:
+        return True
+    if word in FALSE_WORDS:
+        return False
+    return None
+
+
+def as_option(text):
+    """'B', 'b)', '(b) Paris' -> 'b'"""
+    match = _OPTION_RE.match(str(text).strip())
+    return next(letter for letter in match.groups() if letter).lower() if match else None
+
+
+def as_number(text):
+    """
+    "4", "-0.5", ".1", "1,200", "3/4", "10^3", "2.5 x 10^4", "4 m/s2" (trailing unit)
+    -> float, None for anything else (left to the LLM)
+    """
+    return parse_number(text)[0]
+
+
+def parse_number(text):
+    """(value, unit) for as_number; unit is "" when there is none, value None if not a number"""
+    value = unicodedata.normalize("NFKC", str(text)).translate(_ARABIC_DIGITS).lower().strip()
+    value = re.sub(r"(?<=\d),(?=\d{3})", "", value)
+    value = re.sub(r"\s*(\*\*|[/^*×])\s*", r"\1", value)
+    value = re.sub(r"(?<=\d)\s*x\s*(?=10\^|10\*\*)", "x", value)
+    number, _, unit = value.partition(" ")
+    number = number.rstrip(".")
+    if unit and not re.match(r"^[a-z%°µ]", unit):
+        return None, ""
+    # "m/s^2", "m / s2" -> "m/s2"
+    unit = re.sub(r"\s+|\^|\*\*", "", unit).rstrip(".")
+    try:
+        if _NUMBER_RE.match(number):
+            result = float(number)
+            return (result if math.isfinite(result) else None), unit
+        match = _FRACTION_RE.match(number)
+        if match:
+            return float(Fraction(match.group(1)) / Fraction(match.group(2))), unit
+        match = _POWER_RE.match(number) or _SCIENTIFIC_RE.match(number)
+        if match:
+            base, power = float(match.group(1)), float(match.group(2))
+            if abs(power) > MAX_POWER:
+                return None, ""
+            result = base * 10 ** power if _SCIENTIFIC_RE.match(number) else base ** power
+            return (result if math.isfinite(result) else None), unit
+    except (ValueError, ZeroDivisionError, OverflowError):
+        return None, ""
+    return None, ""
+
+
+def detect_type(correct_answer):
+    """Guess how an answer should be graded from its correct answer"""
+    key = normalize(correct_answer)
+    # Single letters (even T / F) are option letters: graded as the letter itself
+    if as_option(correct_answer) is not None and len(key) <= 2:
+        return "mcq"
+    if len(key) > 1 and as_bool(correct_answer) is not None:
+        return "true_false"
+    if as_number(correct_answer) is not None:
+        return "numeric"
+    return "free_text"
+
+
+def parse_tolerance(value):
+    """Relative tolerance from a request, ValueError if it is not a non-negative number"""
+    if value is None:
+        return DEFAULT_TOLERANCE
+    if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+        raise ValueError("tolerance must be a number")
+    try:
+        tolerance = float(value)
+    except ValueError:
+        raise ValueError("tolerance must be a number")
+    if not math.isfinite(tolerance) or tolerance < 0:
+        raise ValueError("tolerance must be a non-negative number")
+    return tolerance
+
+
+def grade_one(student_answer, correct_answer, answer_type=None, tolerance=DEFAULT_TOLERANCE):
+    """
+    Grade one answer locally.
+    Returns (answer_type, correct) where correct is None if the LLM has to decide.
+
+    Numbers are compared with the relative tolerance only when the caller says
+    the answer is "numeric"; auto-detected numbers must match exactly.
+    """
+    use_tolerance = answer_type == "numeric"
+    answer_type = answer_type or detect_type(correct_answer)
+    if student_answer is None or str(student_answer).strip() == "":
+        return answer_type, False
+
+    if answer_type == "true_false":
+        student = as_bool(student_answer)
+        return answer_type, student is not None and student == as_bool(correct_answer)
+
+    if answer_type == "mcq":
+        student = as_option(student_answer)
+        if student is None:
+            # Answer written out instead of the letter
+            return answer_type, None
+        return answer_type, student == as_option(correct_answer)
+
+    if answer_type == "numeric":
+        (student, student_unit), (correct, correct_unit) = parse_number(student_answer), parse_number(correct_answer)
+        if student is None or correct is None:
+            return answer_type, None
+        if student_unit and correct_unit and student_unit != correct_unit:
+            return answer_type, None  # "4 kg" for "4 m", or "4000 m" for "4 km": the LLM decides
+        allowed = abs(correct) * tolerance if use_tolerance else 0
+        return answer_type, math.isclose(student, correct, rel_tol=1e-9, abs_tol=max(allowed, 1e-12))
+
+    # Free text / exact: a normalised exact match is correct, anything else needs judgement
+    if normalize(student_answer) == normalize(correct_answer):
+        return "exact", True
+    return "free_text", None
+
+
+def grade_answers(student_answers, correct_answers, answer_types=None, tolerance=DEFAULT_TOLERANCE):
+    """
+    Grade whole answer lists.
+    Returns (results, pending) where results[i] = {"type", "correct", "graded_by"}
+    and pending is the list of indexes the LLM still has to grade.
+    Raises ValueError for lists of different lengths or a bad tolerance.
+    """
+    if len(student_answers) != len(correct_answers):
+        raise ValueError("student_answers and correct_answers must have same length")
+    if answer_types is None:
+        answer_types = [None] * len(student_answers)
+    elif not isinstance(answer_types, list) or len(answer_types) != len(student_answers):
+        raise ValueError("answer_types must be a list with one entry per answer")
+    tolerance = parse_tolerance(tolerance)
+
+    graded = [
+        grade_one(student, correct, answer_type, tolerance)
+        for student, correct, answer_type in zip(student_answers, correct_answers, answer_types)
+    ]
+    results = [
+        {"type": answer_type, "correct": correct, "graded_by": "local" if correct is not None else "llm"}
+        for answer_type, correct in graded
+    ]
+    pending = [i for i, result in enumerate(results) if result["correct"] is None]
+    return results, pending
+
+
+def summarize_results(results):
+    """Counts over graded results (LLM-graded answers are not in local_correct)"""
+    return {
+        "total": len(results),
+        "graded_locally": sum(1 for r in results if r["graded_by"] == "local"),
+        "local_correct": sum(1 for r in results if r["correct"]),
+        "pending_llm": sum(1 for r in results if r["graded_by"] == "llm"),
+    }
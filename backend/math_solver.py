@@ -0,0 +1,488 @@
+"""
+Local fast-path for /math_physics.
+
+Recognisable closed-form questions are solved here with SymPy in a few
+milliseconds instead of a round trip to the LLM:
+
+    equations         solve 2x + 3 = 7 / solve x + y = 3, x - y = 1
+    calculus          derivative of x^2 sin(x) / integrate x^2 dx from 0 to 1
+    algebra           simplify / factor / expand ...
+    arithmetic        what is 3 * (4 + 5)^2
+    physics formulas  F = ma, v = d/t, V = IR, p = mv, KE = mv^2/2, W = Fd, P = W/t, P = VI
+
+solve_locally() returns None for anything else (including physics
+questions where a number can not be tied to exactly one formula
+variable), and the caller asks the LLM. Questions are normalised first (normalize_question) so that the
+cache key is the same for trivially different spellings.
+
+Only a small whitelist of characters, names and exponent sizes is parsed,
+and each solve has a time limit (LOCAL_SOLVER_TIMEOUT), so user input can
+not run code or tie up the gateway.
+"""
+import hashlib
+import os
+import re
+import threading
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+try:
+    import sympy
+    from sympy.parsing.sympy_parser import (
+        auto_number, convert_xor, factorial_notation, implicit_multiplication_application, parse_expr,
+    )
+except ImportError:  # local fast-path disabled, every question goes to the LLM
+    sympy = None
+
+LOCAL_SOLVER_TIMEOUT = float(os.getenv("LOCAL_SOLVER_TIMEOUT", "2"))
+MAX_EXPRESSION_CHARS = 200
+MAX_EXPONENT = 1000
+MAX_FACTORIAL = 1000
+
+_ARABIC_DIGITS = str.maketrans("٠١٢٣٤٥٦٧٨٩", "0123456789")
+_SYMBOL_MAP = str.maketrans({
+    "×": "*", "·": "*", "÷": "/", "−": "-", "–": "-", "²": "^2", "³": "^3",
+    "√": "sqrt", "π": "pi", "Ω": " ohm", "ω": " ohm", "،": ",", "؟": "?",
+})
+
+# "log" is not here on purpose: base 10 in homework, natural log in calculus, so the LLM decides
+_FUNCTIONS = {"sin", "cos", "tan", "asin", "acos", "atan", "ln", "exp", "sqrt", "abs", "pi"}
+_EXPRESSION_RE = re.compile(r"^[0-9a-z+\-*/^()., !]+$")
+_NAME_RE = re.compile(r"[a-z]+")
+_LONG_NUMBER_RE = re.compile(r"\d{16,}")
+_PREFIX = r"^(?:please\s+)?(?:find|what is|what's|compute|calculate|determine|evaluate|get)?\s*(?:the\s+)?"
+
+LOCAL_SOLVER_WORKERS = int(os.getenv("LOCAL_SOLVER_WORKERS", "2"))
+# How long a question waits for a free worker before it goes to the LLM
+LOCAL_SOLVER_WAIT = float(os.getenv("LOCAL_SOLVER_WAIT", "0.25"))
+
+# A running solve can not be interrupted, so nothing is queued behind one:
+# when every worker stays busy for LOCAL_SOLVER_WAIT the question goes to the LLM
+_executor = ThreadPoolExecutor(max_workers=LOCAL_SOLVER_WORKERS, thread_name_prefix="math-solver")
+_slots = threading.BoundedSemaphore(LOCAL_SOLVER_WORKERS)
+
+
+def normalize_question(text):
+    """Lowercase, unify digits / operators / whitespace, drop trailing punctuation"""
+    text = unicodedata.normalize("NFKC", str(text)).translate(_ARABIC_DIGITS).translate(_SYMBOL_MAP)
+    text = text.replace("**", "^").lower()
+    text = re.sub(r"\s*([=+*/^(),-])\s*", r" \1 ", text)
+    text = re.sub(r"\(\s+", "(", re.sub(r"\s+\)", ")", text))
+    text = " ".join(text.split()).strip(" ?.:")
+    # Trailing "!" is punctuation, unless it is a factorial ("5!", "(n+1)!")
+    return re.sub(r"(?<![\d)])!+$", "", text).strip(" ?.:")
+
+
+def cache_key(question, variant="answer"):
+    """variant keeps answers of different shapes apart (answer / explain)"""
+    digest = hashlib.sha256(normalize_question(question).encode("utf-8")).hexdigest()
+    return f"math:{variant}:{digest}"
+
+
+def solve_locally(question, timeout=LOCAL_SOLVER_TIMEOUT):
+    """Answer dict for questions the local engine recognises, None otherwise"""
+    if sympy is None:
+        return None
+    question = normalize_question(question)
+    if not question:
+        return None
+    if not _slots.acquire(timeout=LOCAL_SOLVER_WAIT):
+        print(f"Local solver busy, skipped: {question[:80]}")
+        return None
+    future = _executor.submit(_solve, question)
+    future.add_done_callback(lambda _: _slots.release())
+    try:
+        return future.result(timeout=timeout)
+    except FutureTimeout:
+        future.cancel()
+        print(f"Local solver timed out: {question[:80]}")
+    except Exception as e:
+        print(f"Local solver error: {e}")
+    return None
+
+
+def _solve(question):
+    for solver in (solve_physics, solve_calculus, solve_algebra, solve_equations, solve_arithmetic):
+        result = solver(question)
+        if result is not None:
+            result["solver"] = "local"
+            return result
+    return None
+
+
+# -----------------------------
+# Safe parsing
+# -----------------------------
+def parse(text):
+    """SymPy expression for a whitelisted math string, None if it is not one"""
+    text = text.strip().replace(" ", "")
+    if not text or len(text) > MAX_EXPRESSION_CHARS or not _EXPRESSION_RE.match(text):
+        return None
+    if _LONG_NUMBER_RE.search(text):
+        return None
+    for name in _NAME_RE.findall(text):
+        if len(name) > 1 and name not in _FUNCTIONS:
+            return None
+    local_dict = {
+        "ln": sympy.log, "sqrt": sympy.sqrt, "abs": sympy.Abs, "exp": sympy.exp,
+        "sin": sympy.sin, "cos": sympy.cos, "tan": sympy.tan,
+        "asin": sympy.asin, "acos": sympy.acos, "atan": sympy.atan,
+        "pi": sympy.pi, "e": sympy.E,
+    }
+    local_dict.update({c: sympy.Symbol(c) for c in "abcdfghijklmnopqrstuvwxyz" if c not in local_dict})
+    try:
+        expr = parse_expr(
+            text, local_dict=local_dict, global_dict=_GLOBAL_DICT, evaluate=False,
+            transformations=(auto_number, factorial_notation, convert_xor, implicit_multiplication_application),
+        )
+    except Exception:
+        return None
+    if not isinstance(expr, sympy.Expr) or not _safe_sizes(expr):
+        return None
+    return expr
+
+
+def _safe_sizes(expr):
+    """Reject constant exponents / factorials so large that evaluating them would hang (9^9^9, 10^6!)"""
+    for node in sympy.preorder_traversal(expr):
+        if isinstance(node, sympy.Pow):
+            size, limit = node.exp, MAX_EXPONENT
+        elif isinstance(node, (sympy.factorial, sympy.factorial2)):
+            size, limit = node.args[0], MAX_FACTORIAL
+        else:
+            continue
+        if size.free_symbols:
+            continue
+        try:
+            if abs(float(size.evalf(15))) > limit:
+                return False
+        except (TypeError, ValueError):
+            return False
+    return True
+
+
+def _fmt(value):
+    value = sympy.nsimplify(value) if isinstance(value, sympy.Float) and value == int(value) else value
+    return sympy.sstr(value).replace("**", "^").replace("log(", "ln(")
+
+
+def _number(value):
+    value = sympy.N(value, 12)
+    if value.is_real:
+        value = float(value)
+        return int(value) if value == int(value) and abs(value) < 1e15 else round(value, 10)
+    return None
+
+
+if sympy is not None:
+    _GLOBAL_DICT = {
+        "__builtins__": {},
+        "Integer": sympy.Integer, "Float": sympy.Float, "Rational": sympy.Rational,
+        "Symbol": sympy.Symbol, "Function": sympy.Function,
+        "Add": sympy.Add, "Mul": sympy.Mul, "Pow": sympy.Pow,
+        # Unevaluated, so _safe_sizes sees the argument before anything is computed
+        "factorial": lambda n: sympy.factorial(n, evaluate=False),
+        "factorial2": lambda n: sympy.factorial2(n, evaluate=False),
+    }
+
+
+# -----------------------------
+# Math
+# -----------------------------
+_DERIVATIVE_RE = re.compile(
+    _PREFIX + r"(?:derivative of|differentiate|d / d([a-z]) (?:of )?)\s*(.+?)(?: with respect to ([a-z]))?$"
+)
+_INTEGRAL_RE = re.compile(
+    _PREFIX + r"(?:integral of|integrate|antiderivative of)\s*(.+?)"
+    r"(?: d([a-z]))?(?: from (\S+) to (\S+))?(?: d([a-z]))?$"
+)
+_ALGEBRA_RE = re.compile(r"^(simplify|factor|factorise|factorize|expand)\s+(.+)$")
+_SOLVE_RE = re.compile(r"^(?:please\s+)?solve(?: for ([a-z]))?\s*(?:the equations?|the system)?[:,]?\s*(.+)$")
+
+
+def _variable(expr, name=None):
+    if name:
+        return sympy.Symbol(name)
+    symbols = sorted(expr.free_symbols, key=lambda s: s.name)
+    if not symbols:
+        return None
+    return sympy.Symbol("x") if sympy.Symbol("x") in symbols else symbols[0]
+
+
+def solve_calculus(question):
+    match = _DERIVATIVE_RE.match(question)
+    if match:
+        expr = parse(match.group(2))
+        if expr is None:
+            return None
+        var = _variable(expr, match.group(1) or match.group(3))
+        if var is None:
+            return None
+        result = sympy.simplify(sympy.diff(expr.doit(), var))
+        return {
+            "kind": "derivative",
+            "answer": f"d/d{var}({_fmt(expr)}) = {_fmt(result)}",
+            "result": _fmt(result),
+        }
+
+    match = _INTEGRAL_RE.match(question)
+    if match:
+        expr = parse(match.group(1))
+        if expr is None:
+            return None
+        var = _variable(expr, match.group(2) or match.group(5))
+        if var is None:
+            var = sympy.Symbol("x")
+        if match.group(3) is not None:
+            lower, upper = parse(match.group(3)), parse(match.group(4))
+            if lower is None or upper is None:
+                return None
+            result = sympy.integrate(expr.doit(), (var, lower.doit(), upper.doit()))
+            if isinstance(result, sympy.Integral):
+                return None
+            return {
+                "kind": "definite_integral",
+                "answer": f"∫ from {_fmt(lower)} to {_fmt(upper)} of {_fmt(expr)} d{var} = {_fmt(result)}",
+                "result": _fmt(result),
+                "value": _number(result),
+            }
+        result = sympy.integrate(expr.doit(), var)
+        if isinstance(result, sympy.Integral):
+            return None
+        return {
+            "kind": "integral",
+            "answer": f"∫ {_fmt(expr)} d{var} = {_fmt(result)} + C",
+            "result": f"{_fmt(result)} + C",
+        }
+    return None
+
+
+def solve_algebra(question):
+    match = _ALGEBRA_RE.match(question)
+    if not match:
+        return None
+    operation, expr = match.group(1), parse(match.group(2))
+    if expr is None:
+        return None
+    expr = expr.doit()
+    if operation == "simplify":
+        result = sympy.simplify(expr)
+    elif operation == "expand":
+        result = sympy.expand(expr)
+    else:
+        result = sympy.factor(expr)
+    return {"kind": operation.replace("factorise", "factor").replace("factorize", "factor"),
+            "answer": _fmt(result), "result": _fmt(result)}
+
+
+def solve_equations(question):
+    match = _SOLVE_RE.match(question)
+    if match:
+        target, body = match.group(1), match.group(2)
+    elif question.count("=") == 1:
+        target, body = None, re.sub(_PREFIX, "", question)
+    else:
+        return None
+
+    equations = []
+    for part in re.split(r" , | and ", body):
+        sides = part.split(" = ")
+        if len(sides) != 2:
+            return None
+        lhs, rhs = parse(sides[0]), parse(sides[1])
+        if lhs is None or rhs is None:
+            return None
+        equations.append(sympy.Eq(lhs.doit(), rhs.doit()))
+
+    symbols = sorted(set().union(*(eq.free_symbols for eq in equations)), key=lambda s: s.name)
+    if not symbols:
+        return None
+    unknowns = [sympy.Symbol(target)] if target else symbols
+    if len(equations) < len(unknowns) and not target:
+        unknowns = [_variable(equations[0])]
+    solutions = sympy.solve(equations, unknowns, dict=True)
+    if not solutions:
+        return None
+
+    answers = [", ".join(f"{name} = {_fmt(value)}" for name, value in solution.items()) for solution in solutions]
+    return {
+        "kind": "equation" if len(equations) == 1 else "system",
+        "answer": " or ".join(answers),
+        "solutions": [{str(name): _fmt(value) for name, value in solution.items()} for solution in solutions],
+    }
+
+
+def solve_arithmetic(question):
+    expr = parse(re.sub(_PREFIX, "", question))
+    if expr is None or expr.free_symbols:
+        return None
+    exact = sympy.simplify(expr.doit())
+    value = _number(exact)
+    if value is None:
+        return None
+    answer = _fmt(exact)
+    if not exact.is_Integer and str(value) != answer:
+        answer = f"{answer} ≈ {value}"
+    return {"kind": "arithmetic", "answer": answer, "result": _fmt(exact), "value": value}
+
+
+# -----------------------------
+# Physics formulas
+# -----------------------------
+# quantity -> (symbol, SI unit, names in questions)
+QUANTITIES = {
+    "F": ("N", ["force", "net force", "weight"]),
+    "m": ("kg", ["mass"]),
+    "a": ("m/s^2", ["acceleration"]),
+    "v": ("m/s", ["velocity", "speed"]),
+    "d": ("m", ["distance", "displacement"]),
+    "t": ("s", ["time"]),
+    "V": ("V", ["voltage", "potential difference"]),
+    "I": ("A", ["current"]),
+    "R": ("ohm", ["resistance"]),
+    "p": ("kg*m/s", ["momentum"]),
+    "KE": ("J", ["kinetic energy"]),
+    "W": ("J", ["work", "work done"]),
+    "P": ("W", ["power"]),
+}
+
+# unit spelling -> (quantity, factor to SI); only units that are not ambiguous on their own
+UNITS = {
+    "n": ("F", 1), "newton": ("F", 1), "newtons": ("F", 1), "kn": ("F", 1000),
+    "kg": ("m", 1), "kilogram": ("m", 1), "kilograms": ("m", 1), "g": ("m", 0.001), "grams": ("m", 0.001),
+    "m / s ^ 2": ("a", 1), "m / s2": ("a", 1),
+    "m / s": ("v", 1), "km / h": ("v", 1 / 3.6),
+    "m": ("d", 1), "meters": ("d", 1), "metres": ("d", 1), "km": ("d", 1000), "cm": ("d", 0.01),
+    "s": ("t", 1), "sec": ("t", 1), "seconds": ("t", 1), "min": ("t", 60), "minutes": ("t", 60),
+    "h": ("t", 3600), "hours": ("t", 3600),
+    "v": ("V", 1), "volt": ("V", 1), "volts": ("V", 1),
+    "a": ("I", 1), "amp": ("I", 1), "amps": ("I", 1), "ampere": ("I", 1), "amperes": ("I", 1),
+    "ma": ("I", 0.001),
+    "ohm": ("R", 1), "ohms": ("R", 1),
+    "kg * m / s": ("p", 1), "kg m / s": ("p", 1),
+    "j": ("J", 1), "joule": ("J", 1), "joules": ("J", 1), "kj": ("J", 1000),
+    "w": ("P", 1), "watt": ("P", 1), "watts": ("P", 1), "kw": ("P", 1000),
+}
+
+FORMULAS = [
+    ("F = m*a", ("F", "m", "a")),
+    ("v = d/t", ("v", "d", "t")),
+    ("V = I*R", ("V", "I", "R")),
+    ("p = m*v", ("p", "m", "v")),
+    ("KE = m*v^2/2", ("KE", "m", "v")),
+    ("W = F*d", ("W", "F", "d")),
+    ("P = W/t", ("P", "W", "t")),
+    ("P = V*I", ("P", "V", "I")),
+]
+
+_NAMES = sorted(((name, q) for q, (_, names) in QUANTITIES.items() for name in names), key=lambda n: -len(n[0]))
+_NAME_ALT = "|".join(re.escape(name) for name, _ in _NAMES)
+_UNIT_ALT = "|".join(re.escape(unit) for unit in sorted(UNITS, key=len, reverse=True))
+_VALUE = r"(-?\d+(?:\.\d+)?(?:e-?\d+)?)"
+_NAMED_VALUE_RE = re.compile(
+    rf"\b({_NAME_ALT})\b(?: of| is| equals| equal to| =|:)?(?: an?| the)? {_VALUE}(?: ({_UNIT_ALT}))?(?![\w/])"
+)
+_UNIT_VALUE_RE = re.compile(rf"{_VALUE} ?({_UNIT_ALT})(?![\w/])")
+_TARGET_RE = re.compile(
+    rf"\b(?:find|calculate|compute|determine|what is|what's|how much is)(?: the| its)?(?: resulting| new)? ({_NAME_ALT})\b"
+)
+_QUANTITY_BY_NAME = dict(_NAMES)
+_NUMBER_RE = re.compile(r"\d+(?:\.\d+)?")
+# Quantities that change during the problem (braking, accelerating from / to, falling...)
+# need kinematics, not one formula from the table
+_NON_UNIFORM_RE = re.compile(
+    r"\b(?:brak\w*|stop\w*|rest|decelerat\w*|accelerates|accelerating|slow\w*|speeds up|initial\w*|final\w*"
+    r"|average|increas\w*|decreas\w*|chang\w*|friction|inclin\w*|angle|height|fall\w*|drop\w*|thrown"
+    r"|projectile|gravity|from [^,]* to)\b"
+)
+
+
+def _covered(span, spans):
+    return any(start <= span[0] and span[1] <= end for start, end in spans)
+
+
+def _given_values(text):
+    """
+    quantity -> SI value for every number in the text, None unless each number is
+    matched to exactly one quantity (and each quantity to one number).
+    Energies without a name are kept as "J" until the formula picks KE or W.
+    """
+    given, used = {}, []
+    for match in _NAMED_VALUE_RE.finditer(text):
+        name, value, unit = match.groups()
+        quantity, factor = _QUANTITY_BY_NAME[name], 1
+        if unit:
+            unit_quantity, factor = UNITS[unit]
+            if unit_quantity != quantity and not (unit_quantity == "J" and quantity in ("KE", "W")):
+                return None  # unit does not fit the quantity
+        if quantity in given:
+            return None
+        given[quantity] = float(value) * factor
+        used.append(match.span())
+    for match in _UNIT_VALUE_RE.finditer(text):
+        if _covered(match.span(1), used):
+            continue
+        quantity, factor = UNITS[match.group(2)]
+        if quantity in given:
+            return None  # two speeds, two masses... not a single-formula problem
+        given[quantity] = float(match.group(1)) * factor
+        used.append(match.span())
+    if any(not _covered(number.span(), used) for number in _NUMBER_RE.finditer(text)):
+        return None
+    return given
+
+
+def solve_physics(question):
+    target_match = _TARGET_RE.search(question)
+    if not target_match:
+        return None
+    target = _QUANTITY_BY_NAME[target_match.group(1)]
+    text = f"{question[:target_match.start()]} {question[target_match.end():]}"
+    if _NON_UNIFORM_RE.search(text):
+        return None
+    given = _given_values(text)
+    if not given or target in given:
+        return None
+
+    for formula, symbols in FORMULAS:
+        if target not in symbols:
+            continue
+        needed = [s for s in symbols if s != target]
+        values = dict(given)
+        if "J" in values:
+            energy = [s for s in needed if s in ("KE", "W") and s not in values]
+            if len(energy) != 1:
+                continue
+            values[energy[0]] = values.pop("J")
+        # Every given number must be used by this formula, and nothing else is needed
+        if set(values) != set(needed):
+            continue
+
+        lhs, rhs = formula.split(" = ")
+        names = {s: sympy.Symbol(s) for s in symbols}
+        equation = sympy.Eq(parse_expr(lhs, local_dict=names), parse_expr(rhs.replace("^", "**"), local_dict=names))
+        unknown = names[target]
+        solutions = [s for s in sympy.solve(equation, unknown) if s.is_real is not False]
+        if not solutions:
+            continue
+        expression = solutions[-1]
+        result = expression.subs({names[s]: values[s] for s in needed})
+        value = _number(result)
+        if value is None:
+            continue
+        unit = QUANTITIES[target][0]
+        steps = [formula]
+        if f"{target} = {_fmt(expression)}" != formula:
+            steps.append(f"{target} = {_fmt(expression)}")
+        steps.append(", ".join(f"{s} = {values[s]:g} {QUANTITIES[s][0]}" for s in needed))
+        steps.append(f"{target} = {value} {unit}")
+        return {
+            "kind": "physics",
+            "formula": formula,
+            "answer": f"{target} = {value} {unit}",
+            "value": value,
+            "unit": unit,
+            "steps": steps,
+            "given": {s: values[s] for s in needed},
+        }
+    return None
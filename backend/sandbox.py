@@ -0,0 +1,171 @@
+"""
+Local judge for /submit-code.
+
+Each test case runs the submitted Python code in its own sandboxed
+process, set up by sandbox_launcher.py: own mount / network / IPC
+namespaces, a read-only minimal root (Python and system libraries only,
+so no access to the gateway code or .env), unprivileged uid,
+no_new_privs, rlimits on CPU, memory, file size, open files and child
+processes, empty environment. If the sandbox can not be set up (no
+namespace support), judge() raises SandboxError instead of running the
+code unconfined.
+
+Tests run in parallel on SANDBOX_WORKERS cores and judging stops at the
+first failing test.
+
+Test case format: {"input": "<stdin>", "expected_output": "<stdout>"}
+("stdin" / "output" / "expected" are accepted as aliases).
+"""
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+SANDBOX_WORKERS = int(os.getenv("SANDBOX_WORKERS", str(os.cpu_count() or 1)))
+SANDBOX_TIMEOUT = float(os.getenv("SANDBOX_TIMEOUT", "5"))  # wall seconds per test
+SANDBOX_MEMORY_MB = int(os.getenv("SANDBOX_MEMORY_MB", "256"))
+SANDBOX_OUTPUT_LIMIT = 64 * 1024  # bytes of stdout/stderr kept per test
+
+LAUNCHER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sandbox_launcher.py")
+
+
+class SandboxError(Exception):
+    """The sandbox could not be set up, the code was not run"""
+
+
+def normalize_test(test):
+    return {
+        "input": str(test.get("input", test.get("stdin", "")) or ""),
+        "expected_output": str(test.get("expected_output", test.get("output", test.get("expected", ""))) or ""),
+    }
+
+
+def _same_output(actual, expected):
+    clean = lambda text: [line.rstrip() for line in text.strip().splitlines()]
+    return clean(actual) == clean(expected)
+
+
+class Judge:
+    def __init__(self, workers=SANDBOX_WORKERS):
+        self.workers = max(1, workers)
+
+    def _run_test(self, index, code_path, work_dir, test, stop, running, running_lock):
+        if stop.is_set():
+            return {"index": index, "status": "skipped", "passed": False, "time_ms": 0}
+
+        start = time.perf_counter()
+        status_read, status_write = os.pipe()
+        cpu = int(SANDBOX_TIMEOUT) + 1
+        memory = SANDBOX_MEMORY_MB * 1024 * 1024
+        try:
+            # Own session, so a timeout kills everything it started
+            process = subprocess.Popen(
+                [sys.executable, "-I", "-S", LAUNCHER, str(status_write), code_path, str(cpu), str(memory)],
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                cwd=work_dir, env={}, start_new_session=True, pass_fds=(status_write,),
+            )
+        finally:
+            os.close(status_write)
+        with running_lock:
+            running.add(process)
+        try:
+            with os.fdopen(status_read, "rb") as status_pipe:
+                setup = status_pipe.read().decode("utf-8", "replace")
+            if setup != "ok" and not stop.is_set():
+                process.kill()
+                process.communicate()
+                raise SandboxError(setup or f"sandbox launcher exited with {process.wait()}")
+            stdout, stderr = process.communicate(test["input"].encode("utf-8"), timeout=SANDBOX_TIMEOUT)
+            status = None
+        except subprocess.TimeoutExpired:
+            os.killpg(process.pid, signal.SIGKILL)
+            stdout, stderr = process.communicate()
+            status = "timeout"
+        finally:
+            with running_lock:
+                running.discard(process)
+        elapsed = (time.perf_counter() - start) * 1000
+
+        stdout = stdout[:SANDBOX_OUTPUT_LIMIT].decode("utf-8", "replace")
+        stderr = stderr[:SANDBOX_OUTPUT_LIMIT].decode("utf-8", "replace")
+        if status is None:
+            if stop.is_set() and process.returncode < 0:
+                status = "skipped"  # killed because another test failed
+            elif process.returncode == -signal.SIGXCPU:
+                status = "timeout"
+            elif process.returncode != 0:
+                status = "error"
+            else:
+                status = "passed" if _same_output(stdout, test["expected_output"]) else "failed"
+
+        return {
+            "index": index,
+            "status": status,
+            "passed": status == "passed",
+            "time_ms": round(elapsed, 2),
+            "stdout": stdout,
+            "stderr": stderr,
+        }
+
+    @staticmethod
+    def _kill(running, running_lock):
+        with running_lock:
+            for process in running:
+                try:
+                    os.killpg(process.pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+
+    def judge(self, code, tests, stop_on_failure=True):
+        """Run code against every test, returns a summary with per-test results and timings"""
+        tests = [normalize_test(t) for t in tests]
+        work_dir = tempfile.mkdtemp(prefix="judge_")
+        code_path = os.path.join(work_dir, "solution.py")
+        with open(code_path, "w", encoding="utf-8") as f:
+            f.write(code)
+
+        stop = threading.Event()
+        running, running_lock = set(), threading.Lock()
+        results = []
+        start = time.perf_counter()
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                pending = {
+                    pool.submit(self._run_test, i, code_path, work_dir, test, stop, running, running_lock)
+                    for i, test in enumerate(tests)
+                }
+                while pending:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        try:
+                            result = future.result()
+                        except SandboxError:
+                            stop.set()
+                            self._kill(running, running_lock)
+                            raise
+                        results.append(result)
+                        if stop_on_failure and result["status"] not in ("passed", "skipped") and not stop.is_set():
+                            stop.set()
+                            self._kill(running, running_lock)
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+        results.sort(key=lambda r: r["index"])
+        passed = sum(1 for r in results if r["passed"])
+        first_failure = next((r["index"] for r in results if r["status"] not in ("passed", "skipped")), None)
+        return {
+            "passed": passed,
+            "total": len(tests),
+            "all_passed": passed == len(tests),
+            "first_failure": first_failure,
+            "time_ms": round((time.perf_counter() - start) * 1000, 2),
+            "results": results,
+        }
+
+
+judge = Judge()
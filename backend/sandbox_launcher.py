@@ -0,0 +1,170 @@
+"""
+Sets up the sandbox for one judge test, then execs the interpreter on the
+submitted code. Started by sandbox.Judge (never imported by the gateway):
+
+    python -I -S sandbox_launcher.py <status_fd> <solution.py> <cpu_s> <memory_bytes>
+
+In order:
+
+1. new mount, network and IPC namespaces (plus a user namespace when the
+   gateway does not run as root),
+2. a fresh tmpfs root with only the Python installation and the system
+   libraries bind-mounted read-only (nosuid, nodev), the solution at
+   /sandbox/solution.py and a small writable /tmp,
+3. chroot into it, drop to an unprivileged uid (nobody when started as
+   root; otherwise the caller's uid, whose namespace capabilities are
+   dropped by execve), no_new_privs, rlimits,
+4. exec python on the solution.
+
+"ok" is written to status_fd right before exec. On any setup failure the
+reason is written instead and the launcher exits, so the test never runs
+outside the sandbox.
+"""
+import ctypes
+import os
+import resource
+import sys
+
+CLONE_NEWNS = 0x00020000
+CLONE_NEWIPC = 0x08000000
+CLONE_NEWUSER = 0x10000000
+CLONE_NEWNET = 0x40000000
+
+MS_RDONLY = 0x1
+MS_NOSUID = 0x2
+MS_NODEV = 0x4
+MS_NOEXEC = 0x8
+MS_REMOUNT = 0x20
+MS_NOATIME = 0x400
+MS_NODIRATIME = 0x800
+MS_RELATIME = 1 << 21
+MS_BIND = 0x1000
+MS_REC = 0x4000
+MS_PRIVATE = 1 << 18
+# statvfs flag -> mount flag, kept when remounting read-only
+KEEP_FLAGS = {
+    os.ST_NOEXEC: MS_NOEXEC, os.ST_NOATIME: MS_NOATIME,
+    os.ST_NODIRATIME: MS_NODIRATIME, os.ST_RELATIME: MS_RELATIME,
+}
+
+PR_SET_NO_NEW_PRIVS = 38
+NOBODY = 65534
+
+SYSTEM_PATHS = ["/usr", "/lib", "/lib64", "/lib32", "/bin"]
+DEVICES = ["/dev/null", "/dev/zero", "/dev/urandom"]
+
+libc = ctypes.CDLL(None, use_errno=True)
+
+
+def check(result, what):
+    if result != 0:
+        errno = ctypes.get_errno()
+        raise OSError(errno, f"{what}: {os.strerror(errno)}")
+
+
+def mount(source, target, fstype, flags, data=None):
+    check(libc.mount(
+        source.encode() if source else None, target.encode(),
+        fstype.encode() if fstype else None, flags, data.encode() if data else None,
+    ), f"mount {target}")
+
+
+def write_file(path, text):
+    with open(path, "w") as f:
+        f.write(text)
+
+
+def enter_namespaces():
+    uid, gid = os.getuid(), os.getgid()
+    if uid == 0:
+        check(libc.unshare(CLONE_NEWNS | CLONE_NEWNET | CLONE_NEWIPC), "unshare")
+        return
+    check(libc.unshare(CLONE_NEWUSER | CLONE_NEWNS | CLONE_NEWNET | CLONE_NEWIPC), "unshare")
+    write_file("/proc/self/setgroups", "deny")
+    write_file("/proc/self/uid_map", f"{uid} {uid} 1")
+    write_file("/proc/self/gid_map", f"{gid} {gid} 1")
+
+
+def bind_readonly(path, new_root):
+    target = new_root + path
+    if os.path.islink(path):
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        if not os.path.lexists(target):
+            os.symlink(os.readlink(path), target)
+        return
+    if os.path.isdir(path):
+        os.makedirs(target, exist_ok=True)
+    else:
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        open(target, "a").close()
+    mount(path, target, None, MS_BIND | MS_REC)
+    # Keep the flags of the original mount (locked inside a user namespace)
+    current = os.statvfs(path).f_flag
+    flags = sum(ms for st, ms in KEEP_FLAGS.items() if current & st)
+    mount(None, target, None, MS_BIND | MS_REMOUNT | MS_RDONLY | MS_NOSUID | MS_NODEV | flags)
+
+
+def build_root(solution_path):
+    new_root = os.path.join(os.path.dirname(solution_path), "root")
+    os.makedirs(new_root, exist_ok=True)
+    with open(solution_path, "rb") as f:
+        code = f.read()
+
+    mount(None, "/", None, MS_REC | MS_PRIVATE)
+    mount("tmpfs", new_root, "tmpfs", MS_NOSUID | MS_NODEV, "size=16m,mode=755")
+
+    python_dirs = {sys.base_prefix, sys.prefix, os.path.dirname(os.path.realpath(sys.executable))}
+    for path in SYSTEM_PATHS + sorted(python_dirs):
+        if os.path.lexists(path) and not os.path.exists(new_root + path):
+            bind_readonly(path, new_root)
+    for device in DEVICES:
+        try:
+            bind_readonly(device, new_root)
+        except OSError:
+            pass  # the interpreter works without them
+
+    os.makedirs(new_root + "/sandbox")
+    with open(new_root + "/sandbox/solution.py", "wb") as f:
+        f.write(code)
+    os.makedirs(new_root + "/tmp")
+    os.chmod(new_root + "/tmp", 0o1777)
+
+    os.chroot(new_root)
+    os.chdir("/sandbox")
+
+
+def drop_privileges(cpu, memory):
+    if os.getuid() == 0:
+        os.setgroups([])
+        os.setgid(NOBODY)
+        os.setuid(NOBODY)
+    check(libc.prctl(PR_SET_NO_NEW_PRIVS, 1, 0, 0, 0), "prctl")
+    resource.setrlimit(resource.RLIMIT_CPU, (cpu, cpu))
+    resource.setrlimit(resource.RLIMIT_AS, (memory, memory))
+    resource.setrlimit(resource.RLIMIT_FSIZE, (1024 * 1024, 1024 * 1024))
+    resource.setrlimit(resource.RLIMIT_NOFILE, (32, 32))
+    resource.setrlimit(resource.RLIMIT_CORE, (0, 0))
+    resource.setrlimit(resource.RLIMIT_NPROC, (0, 0))  # no fork / subprocess
+
+
+def main():
+    status_fd, solution_path = int(sys.argv[1]), sys.argv[2]
+    cpu, memory = int(sys.argv[3]), int(sys.argv[4])
+    python = os.path.realpath(sys.executable)
+    try:
+        enter_namespaces()
+        build_root(solution_path)
+        drop_privileges(cpu, memory)
+        if not os.access(python, os.X_OK):
+            raise OSError(f"{python} is not available in the sandbox")
+    except Exception as e:
+        os.write(status_fd, f"sandbox setup failed: {e}".encode())
+        os._exit(125)
+
+    os.write(status_fd, b"ok")
+    os.close(status_fd)
+    os.execve(python, [python, "-I", "-S", "/sandbox/solution.py"], {})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Response shaping for the gateway.
+
+- echo_inputs(): request echo in responses is off by default
+  (GATEWAY_ECHO_INPUTS=off|hash|full)
+- OrjsonProvider: fast JSON encoding for jsonify (when orjson is installed)
+- compress_response(): gzip / brotli for large bodies, negotiated with Accept-Encoding
+"""
+import gzip
+import hashlib
+import json
+import os
+
+from flask import request
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # optional, falls back to the stdlib encoder
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # optional, gzip only
+    brotli = None
+
+GATEWAY_ECHO_INPUTS = os.getenv("GATEWAY_ECHO_INPUTS", "off")
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
+COMPRESS_LEVEL = int(os.getenv("COMPRESS_LEVEL", "5"))
+# Never buffered for compression, partial results must reach the client as they come
+STREAM_MIMETYPES = {"application/x-ndjson", "text/event-stream"}
+
+
+def echo_inputs(inputs):
+    """What to send back of the request: None (off), its sha256 (hash) or the inputs (full)"""
+    if GATEWAY_ECHO_INPUTS == "full":
+        return inputs
+    if GATEWAY_ECHO_INPUTS == "hash":
+        raw = json.dumps(inputs, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8")
+        return {"sha256": hashlib.sha256(raw).hexdigest()}
+    return None
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """jsonify() with orjson, writing bytes straight into the response"""
+    option = orjson.OPT_NON_STR_KEYS if orjson else 0
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default, option=self.option).decode("utf-8")
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        body = orjson.dumps(obj, default=self.default, option=self.option)
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+
+def compress_response(response):
+    """after_request hook: compress large, non-streamed bodies the client accepts"""
+    accept = request_accept_encoding()
+    if (
+        not accept
+        or response.direct_passthrough
+        or response.is_streamed
+        or response.mimetype in STREAM_MIMETYPES
+        or response.status_code < 200
+        or response.status_code in (204, 304)
+        or "Content-Encoding" in response.headers
+        or (response.content_length or 0) < COMPRESS_MIN_BYTES
+    ):
+        return response
+
+    if brotli is not None and "br" in accept:
+        body, encoding = brotli.compress(response.get_data(), quality=COMPRESS_LEVEL), "br"
+    elif "gzip" in accept:
+        body, encoding = gzip.compress(response.get_data(), compresslevel=COMPRESS_LEVEL), "gzip"
+    else:
+        return response
+
+    response.set_data(body)
+    response.headers["Content-Encoding"] = encoding
+    response.vary.add("Accept-Encoding")
+    return response
+
+
+def request_accept_encoding():
+    return {
+        part.split(";")[0].strip().lower()
+        for part in request.headers.get("Accept-Encoding", "").split(",")
+        if part.strip() and not part.strip().endswith("q=0")
+    }
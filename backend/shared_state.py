@@ -0,0 +1,390 @@
+"""
+Shared state for running several workers / hosts of main.py and backend/app.py.
+
+Caches, sessions and rate-limit counters go through one small key-value
+interface with two implementations:
+
+    sqlite:///shared_state.db     one host, any number of worker processes
+    redis://host:6379/0           several hosts (Redis, Valkey, KeyDB, ...)
+    rediss://host:6380/0          the same over TLS
+
+STATE_BACKEND_URL picks the backend (default sqlite:///shared_state.db).
+
+For tests / local runs without Redis there is a small Redis-protocol
+stand-in backed by SQLite:
+
+    python backend/shared_state.py serve --port 6380
+    STATE_BACKEND_URL=redis://127.0.0.1:6380/0 python app.py
+"""
+import json
+import os
+import socket
+import sqlite3
+import ssl
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+STATE_BACKEND_URL = os.getenv("STATE_BACKEND_URL", "sqlite:///shared_state.db")
+# Expired SQLite rows are skipped on read and purged on write at most this often
+SQLITE_PURGE_INTERVAL = int(os.getenv("SQLITE_PURGE_INTERVAL", "300"))
+
+
+class StateBackend:
+    """get / set / add / delete / incr on string keys, values are str"""
+
+    def get(self, key):
+        raise NotImplementedError
+
+    def set(self, key, value, ttl=None):
+        raise NotImplementedError
+
+    def add(self, key, value, ttl=None):
+        """Set only if the key does not exist, returns True if it was set"""
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def delete_if(self, key, value):
+        """Delete key only if it still holds value (atomic), returns True if it was deleted"""
+        raise NotImplementedError
+
+    def incr(self, key, ttl=None):
+        """Increment a counter, ttl (seconds) is applied when the counter is created"""
+        raise NotImplementedError
+
+    def get_json(self, key, default=None):
+        value = self.get(key)
+        return json.loads(value) if value is not None else default
+
+    def set_json(self, key, value, ttl=None):
+        self.set(key, json.dumps(value, ensure_ascii=False), ttl)
+
+    @contextmanager
+    def lock(self, name, ttl=30, wait=10):
+        """Cross-process lock (expires after ttl seconds if the holder dies)"""
+        key, token = f"lock:{name}", uuid.uuid4().hex
+        deadline = time.time() + wait
+        while not self.add(key, token, ttl):
+            if time.time() > deadline:
+                raise TimeoutError(f"Could not acquire lock {name}")
+            time.sleep(0.05)
+        try:
+            yield
+        finally:
+            # Compare-and-delete: after our ttl ran out the key may hold another worker's token
+            self.delete_if(key, token)
+
+
+# -----------------------------
+# SQLite
+# -----------------------------
+class SQLiteBackend(StateBackend):
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._next_purge = 0
+        self._purge_lock = threading.Lock()
+        self._conn().execute(
+            "CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL)"
+        )
+        self._conn().execute("CREATE INDEX IF NOT EXISTS kv_expires ON kv (expires)")
+
+    def _purge_expired(self):
+        """Delete expired rows, at most once every SQLITE_PURGE_INTERVAL seconds per process"""
+        now = time.time()
+        with self._purge_lock:
+            if now < self._next_purge:
+                return
+            self._next_purge = now + SQLITE_PURGE_INTERVAL
+        self._conn().execute("DELETE FROM kv WHERE expires IS NOT NULL AND expires <= ?", (now,))
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _expires(ttl):
+        return time.time() + ttl if ttl else None
+
+    def get(self, key):
+        row = self._conn().execute(
+            "SELECT value FROM kv WHERE key = ? AND (expires IS NULL OR expires > ?)", (key, time.time())
+        ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key, value, ttl=None):
+        self._purge_expired()
+        self._conn().execute(
+            "INSERT OR REPLACE INTO kv (key, value, expires) VALUES (?, ?, ?)", (key, value, self._expires(ttl))
+        )
+
+    def add(self, key, value, ttl=None):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM kv WHERE key = ? AND expires IS NOT NULL AND expires <= ?", (key, time.time()))
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO kv (key, value, expires) VALUES (?, ?, ?)", (key, value, self._expires(ttl))
+            )
+            conn.execute("COMMIT")
+            return cursor.rowcount == 1
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def delete(self, key):
+        self._conn().execute("DELETE FROM kv WHERE key = ?", (key,))
+
+    def delete_if(self, key, value):
+        cursor = self._conn().execute("DELETE FROM kv WHERE key = ? AND value = ?", (key, value))
+        return cursor.rowcount == 1
+
+    def incr(self, key, ttl=None):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT value FROM kv WHERE key = ? AND (expires IS NULL OR expires > ?)", (key, time.time())
+            ).fetchone()
+            if row:
+                value = int(row[0]) + 1
+                conn.execute("UPDATE kv SET value = ? WHERE key = ?", (str(value), key))
+            else:
+                value = 1
+                conn.execute(
+                    "INSERT OR REPLACE INTO kv (key, value, expires) VALUES (?, ?, ?)",
+                    (key, "1", self._expires(ttl))
+                )
+            conn.execute("COMMIT")
+            return value
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def expire(self, key, ttl):
+        self._conn().execute("UPDATE kv SET expires = ? WHERE key = ?", (self._expires(ttl), key))
+
+
+# -----------------------------
+# Redis protocol (RESP) client, no extra dependency
+# -----------------------------
+class RedisError(Exception):
+    pass
+
+
+# Lua scripts run with EVAL, so each is one atomic step on the server
+DELETE_IF_SCRIPT = (
+    "if redis.call('GET', KEYS[1]) == ARGV[1] then return redis.call('DEL', KEYS[1]) else return 0 end"
+)
+INCR_SCRIPT = (
+    "local value = redis.call('INCR', KEYS[1]) "
+    "if value == 1 and tonumber(ARGV[1]) > 0 then redis.call('PEXPIRE', KEYS[1], ARGV[1]) end "
+    "return value"
+)
+
+
+def encode_command(*args):
+    out = [f"*{len(args)}\r\n".encode()]
+    for arg in args:
+        data = arg if isinstance(arg, bytes) else str(arg).encode("utf-8")
+        out.append(b"$%d\r\n%s\r\n" % (len(data), data))
+    return b"".join(out)
+
+
+def read_reply(reader):
+    line = reader.readline()
+    if not line:
+        raise ConnectionError("Connection closed")
+    kind, rest = line[:1], line[1:-2]
+    if kind == b"+":
+        return rest.decode("utf-8")
+    if kind == b"-":
+        raise RedisError(rest.decode("utf-8"))
+    if kind == b":":
+        return int(rest)
+    if kind == b"$":
+        length = int(rest)
+        if length == -1:
+            return None
+        data = reader.read(length + 2)[:-2]
+        return data.decode("utf-8")
+    if kind == b"*":
+        count = int(rest)
+        return None if count == -1 else [read_reply(reader) for _ in range(count)]
+    raise RedisError(f"Unknown reply type: {line!r}")
+
+
+class RedisBackend(StateBackend):
+    def __init__(self, url):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "127.0.0.1"
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.db = int((parsed.path or "/0").lstrip("/") or 0)
+        self.tls = parsed.scheme == "rediss"
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            sock = socket.create_connection((self.host, self.port), timeout=10)
+            if self.tls:
+                sock = ssl.create_default_context().wrap_socket(sock, server_hostname=self.host)
+            conn = (sock, sock.makefile("rb"))
+            self._local.conn = conn
+            if self.password:
+                self.command("AUTH", self.password)
+            if self.db:
+                self.command("SELECT", self.db)
+        return conn
+
+    def command(self, *args):
+        for attempt in range(2):
+            sock, reader = self._connection()
+            try:
+                sock.sendall(encode_command(*args))
+                return read_reply(reader)
+            except (ConnectionError, OSError):
+                self._local.conn = None  # reconnect once
+                if attempt:
+                    raise
+
+    def get(self, key):
+        return self.command("GET", key)
+
+    def set(self, key, value, ttl=None):
+        if ttl:
+            self.command("SET", key, value, "PX", int(ttl * 1000))
+        else:
+            self.command("SET", key, value)
+
+    def add(self, key, value, ttl=None):
+        args = ["SET", key, value, "NX"]
+        if ttl:
+            args += ["PX", int(ttl * 1000)]
+        return self.command(*args) == "OK"
+
+    def delete(self, key):
+        self.command("DEL", key)
+
+    def delete_if(self, key, value):
+        return self.command("EVAL", DELETE_IF_SCRIPT, 1, key, value) == 1
+
+    def incr(self, key, ttl=None):
+        return self.command("EVAL", INCR_SCRIPT, 1, key, int(ttl * 1000) if ttl else 0)
+
+
+# -----------------------------
+# Factory
+# -----------------------------
+_backends = {}
+_backends_lock = threading.Lock()
+
+
+def get_state(url=None):
+    """Shared backend instance for a URL (STATE_BACKEND_URL by default)"""
+    url = url or STATE_BACKEND_URL
+    with _backends_lock:
+        if url not in _backends:
+            scheme = urlparse(url).scheme
+            if scheme == "sqlite":
+                _backends[url] = SQLiteBackend(url[len("sqlite:///"):] or "shared_state.db")
+            elif scheme in ("redis", "rediss"):
+                _backends[url] = RedisBackend(url)
+            else:
+                raise ValueError(f"Unsupported STATE_BACKEND_URL: {url}")
+        return _backends[url]
+
+
+# -----------------------------
+# Local Redis-protocol stand-in
+# -----------------------------
+def serve(port, db_path):
+    """Minimal RESP server (GET/SET/DEL/INCR/PEXPIRE/EXPIRE/PING, EVAL of the scripts above) backed by SQLite"""
+    import socketserver
+
+    store = SQLiteBackend(db_path)
+
+    def reply(value):
+        if value is None:
+            return b"$-1\r\n"
+        if isinstance(value, bool):
+            return b":%d\r\n" % int(value)
+        if isinstance(value, int):
+            return b":%d\r\n" % value
+        data = str(value).encode("utf-8")
+        return b"$%d\r\n%s\r\n" % (len(data), data)
+
+    def execute(args):
+        name = args[0].upper()
+        if name in ("PING", "SELECT", "AUTH"):
+            return b"+OK\r\n" if name != "PING" else b"+PONG\r\n"
+        if name == "GET":
+            return reply(store.get(args[1]))
+        if name == "SET":
+            key, value, options = args[1], args[2], [a.upper() for a in args[3:]]
+            ttl = None
+            if "PX" in options:
+                ttl = int(args[3 + options.index("PX") + 1]) / 1000
+            elif "EX" in options:
+                ttl = int(args[3 + options.index("EX") + 1])
+            if "NX" in options:
+                return b"+OK\r\n" if store.add(key, value, ttl) else b"$-1\r\n"
+            store.set(key, value, ttl)
+            return b"+OK\r\n"
+        if name == "DEL":
+            exists = [k for k in args[1:] if store.get(k) is not None]
+            for key in args[1:]:
+                store.delete(key)
+            return reply(len(exists))
+        if name == "INCR":
+            return reply(store.incr(args[1]))
+        if name == "EVAL" and args[1] == DELETE_IF_SCRIPT:
+            return reply(int(store.delete_if(args[3], args[4])))
+        if name == "EVAL" and args[1] == INCR_SCRIPT:
+            return reply(store.incr(args[3], int(args[4]) / 1000))
+        if name in ("PEXPIRE", "EXPIRE"):
+            ttl = int(args[2]) / (1000 if name == "PEXPIRE" else 1)
+            store.expire(args[1], ttl)
+            return reply(1)
+        return f"-ERR unknown command '{name}'\r\n".encode()
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            while True:
+                try:
+                    args = read_reply(self.rfile)
+                except ConnectionError:
+                    return
+                try:
+                    self.wfile.write(execute(args))
+                except Exception as e:
+                    self.wfile.write(f"-ERR {e}\r\n".encode())
+
+    class Server(socketserver.ThreadingTCPServer):
+        allow_reuse_address = True
+        daemon_threads = True
+
+    print(f"Redis-protocol stand-in on 127.0.0.1:{port} (data in {db_path})")
+    with Server(("127.0.0.1", port), Handler) as server:
+        server.serve_forever()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("command", choices=["serve"])
+    parser.add_argument("--port", type=int, default=6380)
+    parser.add_argument("--db", default="redis_standin.db")
+    args = parser.parse_args()
+    serve(args.port, args.db)
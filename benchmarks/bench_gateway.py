@@ -0,0 +1,143 @@
+"""
+Flask gateway vs async gateway, side by side, against a slow fake AI service.
+
+Starts a fake upstream that answers every request after --delay seconds,
+then the gateway in both modes, and fires --requests requests with
+--concurrency in flight at /backend/file3/generate_questions.
+
+    python benchmarks/bench_gateway.py --delay 2 --requests 2000 --concurrency 500
+
+Flask mode runs under gunicorn (--flask-workers x --flask-threads, like a
+production deployment) if it is installed, otherwise the threaded
+development server.
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import subprocess
+import sys
+import time
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BACKEND = os.path.join(ROOT, "backend")
+
+UPSTREAM_PORT = 18000
+FLASK_PORT = 15000
+ASYNC_PORT = 15001
+
+FAKE_UPSTREAM = """
+import asyncio, os
+from fastapi import FastAPI
+app = FastAPI()
+DELAY = float(os.environ["FAKE_DELAY"])
+
+@app.post("/generate_questions")
+async def generate_questions(body: dict):
+    await asyncio.sleep(DELAY)
+    return {"questions": ["q"] * int(body.get("num_questions", 1))}
+"""
+
+PAYLOAD = {"index_name": "bench", "subject": "physics", "num_questions": 3, "question_type": "mcq"}
+
+
+def start(cmd, env, cwd):
+    return subprocess.Popen(cmd, env=env, cwd=cwd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def wait_ready(url, timeout=20):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            httpx.get(url, timeout=1)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise RuntimeError(f"{url} did not start")
+
+
+async def fire(url, total, concurrency):
+    latencies, errors = [], 0
+    semaphore = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(timeout=300, limits=limits) as client:
+        async def one():
+            nonlocal errors
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    resp = await client.post(url, json=PAYLOAD)
+                    if resp.status_code != 200 or "error" in resp.json().get("ai_output", {}):
+                        errors += 1
+                except httpx.HTTPError:
+                    errors += 1
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(total)))
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "elapsed": elapsed,
+        "rps": total / elapsed,
+        "p50": latencies[len(latencies) // 2],
+        "p99": latencies[int(len(latencies) * 0.99) - 1],
+        "errors": errors,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--delay", type=float, default=2.0, help="upstream latency in seconds")
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--flask-workers", type=int, default=2)
+    parser.add_argument("--flask-threads", type=int, default=16)
+    args = parser.parse_args()
+
+    env = {
+        **os.environ,
+        "AI_BASE_URL": f"http://127.0.0.1:{UPSTREAM_PORT}",
+        "FAKE_DELAY": str(args.delay),
+        "CONTENT_POOL_PREFILL": "",
+    }
+    fake_dir = os.path.join(BACKEND, "__bench__")
+    os.makedirs(fake_dir, exist_ok=True)
+    with open(os.path.join(fake_dir, "fake_upstream.py"), "w", encoding="utf-8") as f:
+        f.write(FAKE_UPSTREAM)
+
+    if shutil.which("gunicorn"):
+        flask_cmd = ["gunicorn", "-w", str(args.flask_workers), "--threads", str(args.flask_threads),
+                     "-b", f"127.0.0.1:{FLASK_PORT}", "app:app"]
+        flask_label = f"flask (gunicorn {args.flask_workers}x{args.flask_threads} threads)"
+    else:
+        flask_cmd = [sys.executable, "-c", f"import app; app.app.run(port={FLASK_PORT}, threaded=True)"]
+        flask_label = "flask (threaded dev server)"
+
+    processes = [
+        start([sys.executable, "-m", "uvicorn", "fake_upstream:app", "--port", str(UPSTREAM_PORT)], env, fake_dir),
+        start(flask_cmd, env, BACKEND),
+        start([sys.executable, "-m", "uvicorn", "async_app:app", "--port", str(ASYNC_PORT)], env, BACKEND),
+    ]
+    try:
+        for port in (FLASK_PORT, ASYNC_PORT):
+            wait_ready(f"http://127.0.0.1:{port}/backend/healthcheck")
+
+        print(f"{args.requests} requests, {args.concurrency} in flight, upstream delay {args.delay}s\n")
+        print(f"{'mode':<42} {'total s':>8} {'req/s':>8} {'p50 s':>7} {'p99 s':>7} {'errors':>7}")
+        for label, port in ((flask_label, FLASK_PORT), ("async (uvicorn + httpx)", ASYNC_PORT)):
+            url = f"http://127.0.0.1:{port}/backend/file3/generate_questions"
+            r = asyncio.run(fire(url, args.requests, args.concurrency))
+            print(f"{label:<42} {r['elapsed']:>8.2f} {r['rps']:>8.1f} {r['p50']:>7.2f} {r['p99']:>7.2f} {r['errors']:>7}")
+    finally:
+        for process in processes:
+            process.terminate()
+        shutil.rmtree(fake_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Recall vs latency vs memory for every vector index type.
+
+Runs over a local corpus: a folder of .pdf / .txt files (embedded with
+Gemini, needs GEMINI_API_KEY) or a saved .npy matrix of embeddings.
+Queries are held-out corpus chunks, ground truth is exact (flat) search.
+
+    python benchmarks/bench_index_types.py --corpus ./course_pdfs
+    python benchmarks/bench_index_types.py --vectors embeddings.npy --queries 500
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from vector_store import INDEX_TYPES, create_index  # noqa: E402
+
+
+def load_corpus_vectors(corpus_dir):
+    from dotenv import load_dotenv
+    import google.generativeai as genai
+    from pdf_ingest import extract_pages, gemini_embed, split_text
+
+    load_dotenv()
+    genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+
+    chunks = []
+    for name in sorted(os.listdir(corpus_dir)):
+        path = os.path.join(corpus_dir, name)
+        if name.lower().endswith(".pdf"):
+            with open(path, "rb") as f:
+                pages = extract_pages(f.read())
+        elif name.lower().endswith(".txt"):
+            with open(path, "r", encoding="utf-8") as f:
+                pages = [f.read()]
+        else:
+            continue
+        for page in pages:
+            chunks.extend(split_text(page))
+
+    print(f"Embedding {len(chunks)} chunks from {corpus_dir} ...")
+    return gemini_embed(chunks)
+
+
+def main():
+    import faiss
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--corpus", help="folder of .pdf/.txt files")
+    parser.add_argument("--vectors", help=".npy file of embeddings")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--types", default=",".join(INDEX_TYPES))
+    args = parser.parse_args()
+
+    if args.vectors:
+        vectors = np.load(args.vectors).astype("float32")
+    elif args.corpus:
+        vectors = load_corpus_vectors(args.corpus)
+    else:
+        parser.error("--corpus or --vectors is required")
+
+    faiss.normalize_L2(vectors)
+    rng = np.random.default_rng(0)
+    order = rng.permutation(len(vectors))
+    n_queries = min(args.queries, len(vectors) // 10 or 1)
+    queries, base = vectors[order[:n_queries]], vectors[order[n_queries:]]
+    ids = np.arange(len(base), dtype="int64")
+
+    exact, _ = create_index("flat", base)
+    exact.add_with_ids(base, ids)
+    _, truth = exact.search(queries, args.k)
+
+    print(f"{len(base)} vectors x {base.shape[1]} dims, {n_queries} queries, k={args.k}\n")
+    print(f"{'type':<6} {'actual':<6} {'MB':>8} {'x smaller':>10} {'build s':>8} {'recall':>7} {'ms/query':>9} {'p95 ms':>7}")
+
+    flat_bytes = base.nbytes  # raw float32 embeddings
+    for index_type in args.types.split(","):
+        start = time.perf_counter()
+        index, actual = create_index(index_type, base)
+        index.add_with_ids(base, ids)
+        build = time.perf_counter() - start
+
+        try:
+            faiss.extract_index_ivf(index).nprobe = int(os.getenv("IVF_NPROBE", "16"))
+        except RuntimeError:
+            pass
+
+        size = faiss.serialize_index(index).nbytes
+
+        latencies = []
+        found = np.empty_like(truth)
+        for i, query in enumerate(queries):
+            t = time.perf_counter()
+            _, found[i:i + 1] = index.search(query[None, :], args.k)
+            latencies.append((time.perf_counter() - t) * 1000)
+
+        recall = np.mean([len(set(found[i]) & set(truth[i])) / args.k for i in range(n_queries)])
+        print(
+            f"{index_type:<6} {actual:<6} {size / 1e6:>8.2f} {flat_bytes / size:>10.1f} {build:>8.2f} "
+            f"{recall:>7.3f} {np.mean(latencies):>9.3f} {np.percentile(latencies, 95):>7.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+Cold start time of the AI service: how long `import main` takes in a fresh
+interpreter (what every uvicorn worker pays before it can take traffic).
+
+    python benchmarks/bench_startup.py --runs 10
+    python benchmarks/bench_startup.py --importtime 15   # slowest imports
+
+--importtime runs one import with `python -X importtime` and prints the
+modules with the largest cumulative import time.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def time_import(env):
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", "import main"], cwd=ROOT, env=env, check=True,
+                   stdout=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+
+def import_offenders(env, top):
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"], cwd=ROOT, env=env,
+                            check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((int(cumulative_us), int(self_us), name.strip()))
+    rows.sort(reverse=True)
+    return rows[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--importtime", type=int, default=0, metavar="N", help="show the N slowest imports")
+    args = parser.parse_args()
+
+    env = {**os.environ, "WARMUP_ON_STARTUP": "0"}
+    time_import(env)  # warm the filesystem / bytecode cache
+    times = [time_import(env) for _ in range(args.runs)]
+    print(f"import main over {args.runs} runs: "
+          f"median {statistics.median(times) * 1000:.0f} ms, "
+          f"min {min(times) * 1000:.0f} ms, max {max(times) * 1000:.0f} ms")
+
+    if args.importtime:
+        print(f"\n{'cumulative ms':>14} {'self ms':>8}  module")
+        for cumulative_us, self_us, name in import_offenders(env, args.importtime):
+            print(f"{cumulative_us / 1000:>14.1f} {self_us / 1000:>8.1f}  {name}")
+
+
+if __name__ == "__main__":
+    main()
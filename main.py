@@ -1,23 +1,107 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import StreamingResponse, ORJSONResponse
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
-import google.generativeai as genai
 import os
+import json
+import tempfile
+import threading
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
-from supadata import Supadata, SupadataError
 from urllib.parse import urlparse, parse_qs
+import hashlib
 from fastapi.middleware.cors import CORSMiddleware
 
-
+# Before the local modules below, they read their settings at import time
 load_dotenv()
 
-app = FastAPI()
+from backend.shared_state import get_state
+from backend.asgi_gzip import GZipMiddleware
+from model_router import ModelRouter
+from token_budget import input_budget, preflight, token_metrics
+
+# Open Gemini / Supadata connections before the worker takes traffic
+WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "0") == "1"
+
+
+@asynccontextmanager
+async def lifespan(_):
+    if WARMUP_ON_STARTUP:
+        await run_in_threadpool(warm_up)
+    yield
+
+
+# orjson for every JSON response, gzip for large bodies
+app = FastAPI(default_response_class=ORJSONResponse, lifespan=lifespan)
+app.add_middleware(GZipMiddleware, minimum_size=int(os.getenv("COMPRESS_MIN_BYTES", "1024")))
 
-# Configure Gemini and Supadata
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
-model = genai.GenerativeModel('gemini-2.0-flash-exp')
+# Picks the Gemini model per request (size, task, latency, quota), see model_router.py
+# Gemini is configured on first use, so a bad key does not break startup
+router = ModelRouter()
 
-# Initialize Supadata client
-supadata = Supadata(api_key=os.getenv("YOUTUBE_APIKEY"))
+# Supadata client, created on first use
+_supadata = None
+_supadata_lock = threading.Lock()
+
+
+def get_supadata():
+    global _supadata
+    if _supadata is None:
+        with _supadata_lock:
+            if _supadata is None:
+                from supadata import Supadata
+                _supadata = Supadata(api_key=os.getenv("YOUTUBE_APIKEY"))
+    return _supadata
+
+
+def warm_up():
+    """Create the clients and open their connections (errors are logged, not raised)"""
+    try:
+        get_supadata()
+    except Exception as e:
+        print(f"Supadata warm-up failed: {e}")
+    router.warm_up()
+
+# Transcribe locally when a video has no captions
+LOCAL_TRANSCRIPTION = os.getenv("LOCAL_TRANSCRIPTION", "1") == "1"
+
+# Shared cache for transcripts and LLM responses (same backend for every worker / host)
+state = get_state()
+TRANSCRIPT_CACHE_TTL = int(os.getenv("TRANSCRIPT_CACHE_TTL", str(7 * 24 * 3600)))
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", str(24 * 3600)))
+
+
+def check_input(input_text, task):
+    """
+    Pre-flight token check, before any call to Gemini.
+    Returns ("ok" | "truncate", text) or ("chunk", [texts]); raises 413 if it must be rejected.
+    """
+    budget = input_budget(router.max_context_tokens(), router.output_reserve_tokens)
+    action, value = preflight(input_text, task, budget)
+    if action == "reject":
+        raise HTTPException(
+            status_code=413,
+            detail=f"Input is ~{value} tokens, the limit is {budget} tokens"
+        )
+    return action, value
+
+
+def generate_text(prompt, task="default"):
+    """Generate with the routed model, cached by prompt"""
+    key = "llm:" + hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+    try:
+        cached = state.get(key)
+    except Exception as e:
+        print(f"LLM cache read error: {e}")
+        cached = None
+    if cached is not None:
+        return cached
+    text, _ = router.generate(prompt, task=task)
+    try:
+        state.set(key, text, ttl=LLM_CACHE_TTL)
+    except Exception as e:
+        print(f"LLM cache write error: {e}")
+    return text
 # ✅ CORS configuration
 origins = [
     "http://82.112.253.252:8010",  # frontend URL
@@ -46,6 +130,20 @@ class ChatRequest(BaseModel):
     question: str
 
 # YouTube transcript function with Supadata
+def transcript_payload(transcript):
+    """
+    JSON-serialisable form of a Supadata Transcript (same fields it had in responses),
+    None for empty transcripts and batch jobs
+    """
+    content = getattr(transcript, "content", None)
+    if not content:
+        return None
+    return {
+        "content": content,
+        "lang": getattr(transcript, "lang", ""),
+        "available_langs": getattr(transcript, "available_langs", None) or [],
+    }
+
 def get_youtube_transcript(url, lang='en'):
     """
     Get YouTube transcript using Supadata with automatic language fallback
@@ -57,6 +155,8 @@ def get_youtube_transcript(url, lang='en'):
         lang = 'en'
     
     languages = ['ar', 'en'] if lang == 'ar' else ['en', 'ar']
+    from supadata import SupadataError
+    supadata = get_supadata()
     
     for language in languages:
         try:
@@ -66,8 +166,8 @@ def get_youtube_transcript(url, lang='en'):
                 text=True,  # Return plain text instead of timestamped chunks
                 mode="native"  # Try native subtitles first
             )
-            if transcript:
-                return transcript
+            if transcript_payload(transcript):
+                return transcript_payload(transcript)
         except SupadataError as e:
             print(f"Supadata error for language {language}: {e}")
             continue
@@ -84,14 +184,36 @@ def get_youtube_transcript(url, lang='en'):
                 text=True,
                 mode="auto"  # Try auto-generated subtitles
             )
-            if transcript:
-                return transcript
+            if transcript_payload(transcript):
+                return transcript_payload(transcript)
         except Exception as e:
             print(f"Auto mode error for language {language}: {e}")
             continue
     
     return None
 
+def transcribe_youtube_audio(url, lang=None):
+    """
+    Fallback for caption-less videos: download the audio track with yt-dlp
+    and transcribe it with the local engine (see transcription.py)
+    """
+    import yt_dlp
+    from transcription import get_engine
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        options = {
+            "format": "bestaudio/best",
+            "outtmpl": os.path.join(tmp_dir, "audio.%(ext)s"),
+            "quiet": True,
+            "noplaylist": True,
+        }
+        with yt_dlp.YoutubeDL(options) as ydl:
+            info = ydl.extract_info(url, download=True)
+            audio_path = ydl.prepare_filename(info)
+
+        text = get_engine().transcribe(audio_path, language=lang)
+        return {"content": text, "lang": lang or "", "available_langs": []} if text else None
+
 def extract_video_id(url):
     """Extract video ID from various YouTube URL formats"""
     if 'youtu.be' in url:
@@ -111,7 +233,24 @@ async def get_script(request: GettingTheScript):
         if not video_id:
             raise ValueError("Could not extract video ID from URL")
         
-        text = get_youtube_transcript(youtube_url, language)
+        cache_key = f"transcript:{language}:{video_id}"
+        try:
+            text = state.get_json(cache_key)
+        except Exception as e:
+            print(f"Transcript cache read error: {e}")
+            text = None
+        if text is None:
+            text = get_youtube_transcript(youtube_url, language)
+            if not text and LOCAL_TRANSCRIPTION:
+                try:
+                    text = await run_in_threadpool(transcribe_youtube_audio, youtube_url, language)
+                except Exception as e:
+                    print(f"Local transcription error: {e}")
+            if text:
+                try:
+                    state.set_json(cache_key, text, ttl=TRANSCRIPT_CACHE_TTL)
+                except Exception as e:
+                    print(f"Transcript cache write error: {e}")
         
         if text:
             return {
@@ -145,7 +284,11 @@ async def get_script(request: GettingTheScript):
 # Endpoint for summarization
 @app.post("/summarize")
 async def summarize(request: SummarizationRequest):
-    input_text = request.input_text
+    action, input_text = check_input(request.input_text, "summarize")
+    if action == "chunk":
+        # Map-reduce: summarize every chunk, then summarize the summaries
+        partials = [(await summarize(SummarizationRequest(input_text=chunk)))["summary"] for chunk in input_text]
+        return await summarize(SummarizationRequest(input_text="\n\n".join(partials)))
 
     prompt = f"""
 You are a professional summarization assistant. Your task is to summarize the following text in a clear, concise, and organized manner. Follow these rules:
@@ -176,15 +319,18 @@ Summary:
 """
 
     try:
-        response = model.generate_content(prompt)
-        return {"summary": response.text}
+        return {"summary": generate_text(prompt, task="summarize")}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 # Endpoint for extracting main points
 @app.post("/extract_main_points")
 async def extract_main_points(request: MainPointsRequest):
-    input_text = request.input_text
+    action, input_text = check_input(request.input_text, "extract_main_points")
+    if action == "chunk":
+        # Map-reduce: points of every chunk, then the main points of those
+        partials = [(await extract_main_points(MainPointsRequest(input_text=chunk)))["main_points"] for chunk in input_text]
+        return await extract_main_points(MainPointsRequest(input_text="\n".join(partials)))
     prompt = f"""
 You are a professional assistant. Your task is to extract the main points from the following text and list them in a clear, numbered format (1, 2, 3, ...). Follow these rules:
 1. The main points must be in the same language as the input text.
@@ -218,15 +364,14 @@ Main Points:
 """
 
     try:
-        response = model.generate_content(prompt)
-        return {"main_points": response.text}
+        return {"main_points": generate_text(prompt, task="extract_main_points")}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 # Endpoint for chat with the user
 @app.post("/chat")
 async def chat(request: ChatRequest):
-    input_text = request.input_text
+    _, input_text = check_input(request.input_text, "chat")
     question = request.question
 
     prompt = f"""
@@ -248,11 +393,50 @@ Answer:
 """
 
     try:
-        response = model.generate_content(prompt)
-        return {"answer": response.text}
+        return {"answer": generate_text(prompt, task="chat")}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+# Endpoint for local (offline) transcription of raw audio bytes
+@app.post("/transcribe_local")
+async def transcribe_local(http_request: Request, language: str = None, stream: bool = False, filename: str = "audio.mp3"):
+    from transcription import get_engine
+
+    audio_bytes = await http_request.body()
+    if not audio_bytes:
+        raise HTTPException(status_code=400, detail="Audio body is required")
+
+    suffix = os.path.splitext(filename)[1] or ".mp3"
+    with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as tmp:
+        tmp.write(audio_bytes)
+        audio_path = tmp.name
+
+    engine = get_engine()
+
+    if stream:
+        # NDJSON: one decoded segment per line, as soon as it is ready
+        def generate():
+            try:
+                for segment in engine.transcribe_stream(audio_path, language):
+                    yield json.dumps(segment, ensure_ascii=False) + "\n"
+            finally:
+                os.remove(audio_path)
+
+        return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+    try:
+        text = await run_in_threadpool(engine.transcribe, audio_path, language)
+        return {"status": "success", "engine": engine.name, "language": language, "transcript": text}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        os.remove(audio_path)
+
+# Model routing stats (latency, errors, tokens and cost per model and task)
+@app.get("/metrics")
+async def metrics():
+    return {"router": router.stats(), "tokens": token_metrics.stats()}
+
 # Root endpoint
 @app.get("/")
 async def root():
@@ -0,0 +1,232 @@
+"""
+Pick the Gemini model per request.
+
+Every configured model has a tier (fast / standard / long), a context
+size and a price. For each prompt the router:
+
+1. counts tokens locally and drops models whose context is too small,
+2. orders the rest by tier preference for the prompt size and task,
+3. moves models that miss the task's latency SLO (by their observed
+   latency) behind the ones that meet it. A demoted model is tried first
+   again once its stats are SLO_PROBE_INTERVAL seconds old, so one slow
+   period does not demote it for good,
+4. calls them in that order, falling back to the next model on errors.
+   A model that runs out of quota is skipped for QUOTA_COOLDOWN seconds,
+   one that fails otherwise (retired, unavailable, ...) for ERROR_COOLDOWN.
+
+Latency, error, token and cost stats per model and per task feed the
+ordering and are exposed with stats().
+
+Models can be configured with GEMINI_MODELS (JSON list like DEFAULT_MODELS).
+"""
+import json
+import os
+import threading
+import time
+
+from token_budget import count_tokens
+
+DEFAULT_MODELS = [
+    {"name": "gemini-2.0-flash-lite", "tier": "fast", "context_tokens": 1048576,
+     "input_cost_per_1m": 0.075, "output_cost_per_1m": 0.30},
+    {"name": "gemini-2.0-flash-exp", "tier": "standard", "context_tokens": 1048576,
+     "input_cost_per_1m": 0.10, "output_cost_per_1m": 0.40},
+    {"name": "gemini-2.5-pro", "tier": "long", "context_tokens": 1048576,
+     "input_cost_per_1m": 1.25, "output_cost_per_1m": 10.00},
+]
+
+# Prompt size thresholds (tokens)
+SHORT_PROMPT_TOKENS = int(os.getenv("SHORT_PROMPT_TOKENS", "2000"))
+LONG_PROMPT_TOKENS = int(os.getenv("LONG_PROMPT_TOKENS", "200000"))
+# Tokens kept free for the answer when checking the context size
+OUTPUT_RESERVE_TOKENS = int(os.getenv("OUTPUT_RESERVE_TOKENS", "8192"))
+QUOTA_COOLDOWN = int(os.getenv("QUOTA_COOLDOWN", "60"))
+ERROR_COOLDOWN = int(os.getenv("ERROR_COOLDOWN", "30"))
+
+# Latency SLO per task (ms)
+TASK_SLO_MS = {
+    "chat": 3000,
+    "summarize": 20000,
+    "extract_main_points": 20000,
+}
+DEFAULT_SLO_MS = 10000
+# Latency older than this no longer counts: a demoted model gets one probe request
+SLO_PROBE_INTERVAL = int(os.getenv("SLO_PROBE_INTERVAL", "60"))
+
+EWMA_ALPHA = 0.2
+
+_genai = None
+_genai_lock = threading.Lock()
+
+
+def get_genai():
+    """Import and configure google.generativeai on first use (slow import, needs the key)"""
+    global _genai
+    if _genai is None:
+        with _genai_lock:
+            if _genai is None:
+                import google.generativeai as genai
+                genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+                _genai = genai
+    return _genai
+
+
+def tier_order(tokens, task):
+    """Preferred tiers for a prompt of this size"""
+    if tokens >= LONG_PROMPT_TOKENS:
+        return ["long", "standard", "fast"]
+    if tokens <= SHORT_PROMPT_TOKENS or task == "chat":
+        return ["fast", "standard", "long"]
+    return ["standard", "fast", "long"]
+
+
+def is_quota_error(error):
+    try:
+        from google.api_core import exceptions
+    except ImportError:
+        return False
+    return isinstance(error, (exceptions.ResourceExhausted, exceptions.TooManyRequests))
+
+
+class ModelStats:
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.ewma_ms = None
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.cost = 0.0
+        self.last_sample = 0.0  # time of the last latency sample
+        self.last_attempt = 0.0  # time the model was last tried (incl. probes)
+
+    def is_stale(self, now):
+        return now - max(self.last_sample, self.last_attempt) >= SLO_PROBE_INTERVAL
+
+    def record(self, latency_ms, input_tokens, output_tokens, cost):
+        self.calls += 1
+        now = time.time()
+        # Stale latency ages out instead of dragging the new sample down
+        self.ewma_ms = latency_ms if self.ewma_ms is None or now - self.last_sample >= SLO_PROBE_INTERVAL else (
+            EWMA_ALPHA * latency_ms + (1 - EWMA_ALPHA) * self.ewma_ms
+        )
+        self.last_sample = now
+        self.input_tokens += input_tokens
+        self.output_tokens += output_tokens
+        self.cost += cost
+
+    def as_dict(self):
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "ewma_latency_ms": round(self.ewma_ms, 1) if self.ewma_ms is not None else None,
+            "input_tokens": self.input_tokens,
+            "output_tokens": self.output_tokens,
+            "cost_usd": round(self.cost, 6),
+        }
+
+
+class ModelRouter:
+    def __init__(self, models=None):
+        self.models = models or json.loads(os.getenv("GEMINI_MODELS", "null")) or DEFAULT_MODELS
+        self._clients = {}
+        self._stats = {}  # (model, task) -> ModelStats
+        self._cooldown_until = {}
+        self._lock = threading.Lock()
+        self.output_reserve_tokens = OUTPUT_RESERVE_TOKENS
+
+    def max_context_tokens(self):
+        return max(m["context_tokens"] for m in self.models)
+
+    def _client(self, name):
+        with self._lock:
+            if name not in self._clients:
+                self._clients[name] = get_genai().GenerativeModel(name)
+            return self._clients[name]
+
+    def warm_up(self):
+        """Create every model client and open its connection with a cheap count_tokens call"""
+        for model in self.models:
+            try:
+                self._client(model["name"]).count_tokens("ping")
+            except Exception as e:
+                print(f"Warm-up failed for {model['name']}: {e}")
+
+    def _stat(self, name, task):
+        with self._lock:
+            return self._stats.setdefault((name, task), ModelStats())
+
+    def candidates(self, tokens, task):
+        """Models to try, in order"""
+        now = time.time()
+        fitting = [m for m in self.models if tokens + OUTPUT_RESERVE_TOKENS <= m["context_tokens"]]
+        # Skip models in cooldown, unless that leaves nothing to try
+        available = [m for m in fitting if self._cooldown_until.get(m["name"], 0) <= now]
+        fitting = available or fitting
+        order = tier_order(tokens, task)
+        fitting.sort(key=lambda m: order.index(m["tier"]) if m["tier"] in order else len(order))
+
+        slo = TASK_SLO_MS.get(task, DEFAULT_SLO_MS)
+
+        def misses_slo(model):
+            stat = self._stat(model["name"], task)
+            if stat.ewma_ms is None or stat.ewma_ms <= slo:
+                return False
+            with self._lock:
+                if stat.is_stale(now):
+                    stat.last_attempt = now  # one probe per interval, not every request
+                    return False
+            return True
+
+        # Stable sort: models meeting the SLO first, tier preference kept within each group
+        return sorted(fitting, key=misses_slo)
+
+    def generate(self, prompt, task="default", tokens=None):
+        """Generate with the best model for this prompt, returns (text, model_name)"""
+        tokens = tokens if tokens is not None else count_tokens(prompt)
+        candidates = self.candidates(tokens, task)
+        if not candidates:
+            raise ValueError(f"Prompt of ~{tokens} tokens does not fit any configured model")
+
+        last_error = None
+        for model in candidates:
+            name = model["name"]
+            stat = self._stat(name, task)
+            start = time.perf_counter()
+            try:
+                response = self._client(name).generate_content(prompt)
+                text = response.text
+            except Exception as e:
+                with self._lock:
+                    stat.errors += 1
+                    cooldown = QUOTA_COOLDOWN if is_quota_error(e) else ERROR_COOLDOWN
+                    self._cooldown_until[name] = time.time() + cooldown
+                print(f"Model {name} failed for {task}: {e}")
+                last_error = e
+                continue
+
+            latency_ms = (time.perf_counter() - start) * 1000
+            usage = getattr(response, "usage_metadata", None)
+            input_tokens = getattr(usage, "prompt_token_count", None) or tokens
+            output_tokens = getattr(usage, "candidates_token_count", None) or count_tokens(text)
+            cost = (
+                input_tokens * model.get("input_cost_per_1m", 0)
+                + output_tokens * model.get("output_cost_per_1m", 0)
+            ) / 1_000_000
+            with self._lock:
+                stat.record(latency_ms, input_tokens, output_tokens, cost)
+            return text, name
+
+        raise last_error
+
+    def stats(self):
+        with self._lock:
+            per_model = {}
+            for (name, task), stat in self._stats.items():
+                per_model.setdefault(name, {})[task] = stat.as_dict()
+            return {
+                "models": per_model,
+                "cooldown": {
+                    name: round(until - time.time(), 1)
+                    for name, until in self._cooldown_until.items() if until > time.time()
+                },
+            }
@@ -0,0 +1,243 @@
+"""
+Incremental PDF ingestion into a FAISS index.
+
+Every page and every chunk is content-hashed. Re-uploading a PDF only
+embeds chunks that are new, chunks that disappeared are tombstoned
+(hidden from search, physically removed on compaction). Pages are matched
+by content, so inserting or removing a page only changes that page (the
+page numbers of moved chunks are updated).
+
+On-disk layout of an index (index_path / index_name):
+    <index_dir>/index.faiss     FAISS index (see vector_store.INDEX_TYPES), ids = chunk ids
+    <index_dir>/manifest.json   pages, chunks and tombstones
+
+Use from the AI service /upload_pdf handler:
+    stats = ingest_pdf(index_name, pdf_bytes, file.filename, index_type="sq8")
+
+index_type (see vector_store.INDEX_TYPES) is only used when the index is
+created, later uploads keep the type stored in the manifest.
+"""
+import hashlib
+import io
+import json
+import os
+import threading
+
+import numpy as np
+
+from vector_store import DEFAULT_INDEX_TYPE, INDEX_FILE, MANIFEST_FILE, create_index, index_manager, read_manifest
+
+CHUNK_SIZE = int(os.getenv("PDF_CHUNK_SIZE", "1000"))
+CHUNK_OVERLAP = int(os.getenv("PDF_CHUNK_OVERLAP", "200"))
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "models/text-embedding-004")
+EMBED_BATCH_SIZE = 100
+# Compact once tombstones are more than this share of the index
+COMPACT_RATIO = float(os.getenv("INDEX_COMPACT_RATIO", "0.2"))
+
+# One writer per index at a time
+_index_locks = {}
+_index_locks_guard = threading.Lock()
+
+
+def _lock_for(index_dir):
+    with _index_locks_guard:
+        return _index_locks.setdefault(os.path.abspath(index_dir), threading.Lock())
+
+
+# -----------------------------
+# Hashing / chunking
+# -----------------------------
+def sha256(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def chunk_id(doc_name, text):
+    """Stable positive int64 id for a chunk (FAISS ids must be int64)"""
+    digest = hashlib.sha256(f"{doc_name}\x00{text}".encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") & 0x7FFFFFFFFFFFFFFF
+
+
+def split_text(text, size=CHUNK_SIZE, overlap=CHUNK_OVERLAP):
+    text = text.strip()
+    if not text:
+        return []
+    step = max(1, size - overlap)
+    return [text[i:i + size] for i in range(0, max(len(text) - overlap, 1), step)]
+
+
+def extract_pages(pdf_bytes):
+    """Return the text of every page"""
+    from pypdf import PdfReader
+    reader = PdfReader(io.BytesIO(pdf_bytes))
+    return [page.extract_text() or "" for page in reader.pages]
+
+
+# -----------------------------
+# Embeddings
+# -----------------------------
+def gemini_embed(texts):
+    """Embed a list of texts with Gemini, returns a float32 matrix"""
+    import google.generativeai as genai
+
+    vectors = []
+    for i in range(0, len(texts), EMBED_BATCH_SIZE):
+        batch = texts[i:i + EMBED_BATCH_SIZE]
+        result = genai.embed_content(model=EMBEDDING_MODEL, content=batch, task_type="retrieval_document")
+        vectors.extend(result["embedding"])
+    return np.asarray(vectors, dtype="float32")
+
+
+# -----------------------------
+# Manifest / index storage
+# -----------------------------
+def load_manifest(index_dir):
+    manifest, _ = read_manifest(index_dir)
+    return manifest
+
+
+def save_manifest(index_dir, manifest):
+    path = os.path.join(index_dir, MANIFEST_FILE)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def load_index(index_dir):
+    """Load an index fully in RAM for writing (readers go through index_manager)"""
+    import faiss
+    return faiss.read_index(os.path.join(index_dir, INDEX_FILE))
+
+
+def save_index(index_dir, index):
+    import faiss
+    path = os.path.join(index_dir, INDEX_FILE)
+    tmp_path = path + ".tmp"
+    faiss.write_index(index, tmp_path)
+    os.replace(tmp_path, path)
+
+
+# -----------------------------
+# Ingestion
+# -----------------------------
+def ingest_pdf(index_dir, pdf_bytes, doc_name, embed=gemini_embed, index_type=None):
+    """
+    Upsert a PDF into the index, embedding only new/changed chunks.
+    Returns stats: pages, changed_pages, added_chunks, tombstoned_chunks.
+    """
+    import faiss
+
+    os.makedirs(index_dir, exist_ok=True)
+    pages = extract_pages(pdf_bytes)
+
+    with _lock_for(index_dir):
+        manifest = load_manifest(index_dir)
+        old_pages = manifest["documents"].get(doc_name, {}).get("pages", {})
+        old_by_hash = {page["hash"]: page for page in old_pages.values()}
+        tombstones = set(manifest["tombstones"])
+
+        new_pages = {}
+        new_chunks = {}  # id -> chunk info, only chunks we must embed
+        changed_pages = 0
+
+        for page_no, text in enumerate(pages, start=1):
+            key = str(page_no)
+            page_hash = sha256(text)
+            old = old_by_hash.get(page_hash)
+            if old:
+                new_pages[key] = old
+                continue
+
+            changed_pages += 1
+            ids = []
+            for chunk in split_text(text):
+                cid = chunk_id(doc_name, chunk)
+                ids.append(cid)
+                if cid in tombstones:
+                    # Came back after being deleted: still in the index, just revive it
+                    tombstones.discard(cid)
+                elif cid not in manifest["chunks"]:
+                    new_chunks[cid] = {"doc": doc_name, "page": page_no, "text": chunk}
+            new_pages[key] = {"hash": page_hash, "chunks": ids}
+
+        # Chunks no longer referenced by this document -> tombstones
+        live_ids = {cid for page in new_pages.values() for cid in page["chunks"]}
+        old_ids = {cid for page in old_pages.values() for cid in page["chunks"]}
+        removed = old_ids - live_ids
+        tombstones |= removed
+
+        # Reused chunks may sit on another page now (a page was inserted / removed before them)
+        for key, page in new_pages.items():
+            for cid in page["chunks"]:
+                if cid in manifest["chunks"]:
+                    manifest["chunks"][cid]["page"] = int(key)
+
+        if new_chunks:
+            ids = list(new_chunks)
+            vectors = embed([new_chunks[cid]["text"] for cid in ids])
+            faiss.normalize_L2(vectors)
+            if os.path.exists(os.path.join(index_dir, INDEX_FILE)):
+                index = load_index(index_dir)
+            else:
+                index, manifest["index_type"] = create_index(index_type or DEFAULT_INDEX_TYPE, vectors)
+                manifest["dim"] = int(vectors.shape[1])
+            index.add_with_ids(vectors, np.asarray(ids, dtype="int64"))
+            manifest["chunks"].update(new_chunks)
+        elif removed and os.path.exists(os.path.join(index_dir, INDEX_FILE)):
+            index = load_index(index_dir)
+        else:
+            index = None
+
+        manifest["documents"][doc_name] = {"pages": new_pages}
+        manifest["tombstones"] = sorted(tombstones)
+
+        if index is not None:
+            if tombstones and len(tombstones) > COMPACT_RATIO * max(index.ntotal, 1):
+                compact(index, manifest)
+            save_index(index_dir, index)
+        save_manifest(index_dir, manifest)
+        index_manager.invalidate(index_dir)
+
+    return {
+        "index_type": manifest.get("index_type"),
+        "pages": len(pages),
+        "changed_pages": changed_pages,
+        "added_chunks": len(new_chunks),
+        "tombstoned_chunks": len(removed),
+    }
+
+
+def compact(index, manifest):
+    """Physically remove tombstoned chunks from the index and manifest"""
+    import faiss
+
+    ids = np.asarray(manifest["tombstones"], dtype="int64")
+    if len(ids):
+        index.remove_ids(faiss.IDSelectorBatch(ids))
+    for cid in manifest["tombstones"]:
+        manifest["chunks"].pop(cid, None)
+    manifest["tombstones"] = []
+
+
+def search(index_dir, query_vector, k=4):
+    """Return the top-k live chunks for a query embedding"""
+    import faiss
+
+    entry = index_manager.get(index_dir)
+    if entry is None:
+        return []
+    manifest, tombstones = entry.manifest, entry.tombstones
+
+    query = np.asarray([query_vector], dtype="float32")
+    faiss.normalize_L2(query)
+    scores, ids = entry.index.search(query, k + len(tombstones))
+
+    results = []
+    for score, cid in zip(scores[0], ids[0]):
+        if cid == -1 or int(cid) in tombstones:
+            continue
+        chunk = manifest["chunks"][int(cid)]
+        results.append({"id": int(cid), "score": float(score), **chunk})
+        if len(results) == k:
+            break
+    return results
@@ -0,0 +1,149 @@
+"""
+Local token counting and pre-flight budget checks before calling Gemini.
+
+count_tokens() is a fast estimator (a few regex passes, no network) that
+runs on every prompt. preflight() compares the input with the context
+limit of the configured models and decides what to do with it before
+any upstream call:
+
+    ok        fits, send as is
+    truncate  keep the head and tail of the input (chat)
+    chunk     split into pieces that fit (summaries / main points, map-reduce)
+    reject    fail right away (HTTP 413)
+
+Token counts per task are recorded in token_metrics (exposed at /metrics).
+"""
+import os
+import re
+import threading
+
+# Fudge factor on top of the estimate, so we err on the side of "too big"
+TOKEN_SAFETY_MARGIN = float(os.getenv("TOKEN_SAFETY_MARGIN", "1.1"))
+# Tokens used by the prompt template around the input text
+PROMPT_OVERHEAD_TOKENS = int(os.getenv("PROMPT_OVERHEAD_TOKENS", "1000"))
+# Optional hard cap below the model context (cost control), 0 = model limit only
+MAX_PROMPT_TOKENS = int(os.getenv("MAX_PROMPT_TOKENS", "0"))
+
+TASK_STRATEGY = {
+    "summarize": "chunk",
+    "extract_main_points": "chunk",
+    "chat": "truncate",
+}
+DEFAULT_STRATEGY = "reject"
+
+_LATIN_RE = re.compile(r"[A-Za-z0-9]")
+_CJK_RE = re.compile(r"[぀-ヿ㐀-䶿一-鿿가-힯]")
+_OTHER_LETTER_RE = re.compile(r"[^\W\dA-Za-z_぀-ヿ㐀-䶿一-鿿가-힯]")
+_SYMBOL_RE = re.compile(r"[^\w\s]")
+_WORD_RE = re.compile(r"\S+")
+
+
+def count_tokens(text):
+    """
+    Estimate Gemini tokens for a text.
+    ~4 Latin characters per token, ~3 characters for Arabic and other
+    alphabets, 1 token per CJK character, punctuation ~1 token each.
+    """
+    if not text:
+        return 0
+    latin = len(_LATIN_RE.findall(text))
+    cjk = len(_CJK_RE.findall(text))
+    other = len(_OTHER_LETTER_RE.findall(text))
+    symbols = len(_SYMBOL_RE.findall(text))
+    words = len(_WORD_RE.findall(text))
+    estimate = max(latin / 4 + other / 3 + cjk + symbols, words)
+    return int(estimate * TOKEN_SAFETY_MARGIN) + 1
+
+
+def input_budget(context_tokens, reserve_tokens):
+    """Tokens available for the input text in a prompt"""
+    budget = context_tokens - reserve_tokens - PROMPT_OVERHEAD_TOKENS
+    if MAX_PROMPT_TOKENS:
+        budget = min(budget, MAX_PROMPT_TOKENS - PROMPT_OVERHEAD_TOKENS)
+    return max(budget, 1)
+
+
+def truncate_to_tokens(text, max_tokens):
+    """Keep the first 2/3 and the last 1/3 of the budget"""
+    tokens = count_tokens(text)
+    if tokens <= max_tokens:
+        return text
+    keep_chars = int(len(text) * max_tokens / tokens)
+    head = keep_chars * 2 // 3
+    tail = keep_chars - head
+    return f"{text[:head]}\n...\n{text[len(text) - tail:]}"
+
+
+def split_to_tokens(text, max_tokens):
+    """Split on paragraph / sentence boundaries into pieces of at most max_tokens"""
+    pieces = re.split(r"(?<=\n\n)|(?<=[.!?؟。])\s+", text)
+    chunks, current, current_tokens = [], [], 0
+    for piece in pieces:
+        if not piece:
+            continue
+        piece_tokens = count_tokens(piece)
+        if piece_tokens > max_tokens:
+            # A single huge sentence: hard split by characters
+            step = max(1, int(len(piece) * max_tokens / piece_tokens))
+            for i in range(0, len(piece), step):
+                chunks.append(piece[i:i + step])
+            continue
+        if current and current_tokens + piece_tokens > max_tokens:
+            chunks.append(" ".join(current))
+            current, current_tokens = [], 0
+        current.append(piece)
+        current_tokens += piece_tokens
+    if current:
+        chunks.append(" ".join(current))
+    return chunks
+
+
+def preflight(text, task, budget, strategy=None):
+    """
+    Check an input against the budget.
+    Returns (action, value): ("ok", text), ("truncate", text),
+    ("chunk", [texts]) or ("reject", tokens).
+    """
+    tokens = count_tokens(text)
+    token_metrics.record(task, tokens)
+    if tokens <= budget:
+        return "ok", text
+
+    strategy = strategy or TASK_STRATEGY.get(task, DEFAULT_STRATEGY)
+    token_metrics.record_oversize(task, strategy)
+    if strategy == "truncate":
+        return "truncate", truncate_to_tokens(text, budget)
+    if strategy == "chunk":
+        return "chunk", split_to_tokens(text, budget)
+    return "reject", tokens
+
+
+class TokenMetrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tasks = {}
+
+    def _task(self, task):
+        return self._tasks.setdefault(task, {
+            "requests": 0, "input_tokens": 0, "max_input_tokens": 0,
+            "truncate": 0, "chunk": 0, "reject": 0,
+        })
+
+    def record(self, task, tokens):
+        with self._lock:
+            stats = self._task(task)
+            stats["requests"] += 1
+            stats["input_tokens"] += tokens
+            stats["max_input_tokens"] = max(stats["max_input_tokens"], tokens)
+
+    def record_oversize(self, task, strategy):
+        with self._lock:
+            stats = self._task(task)
+            stats[strategy] = stats.get(strategy, 0) + 1
+
+    def stats(self):
+        with self._lock:
+            return {task: dict(stats) for task, stats in self._tasks.items()}
+
+
+token_metrics = TokenMetrics()
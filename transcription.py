@@ -0,0 +1,139 @@
+"""
+Local (offline, CPU-only) speech-to-text.
+
+Used as a fallback when a YouTube video has no captions, and by the
+/transcribe_local endpoint that the gateway can send /voice_script audio to.
+
+Engines are pluggable: subclass TranscriptionEngine, implement
+transcribe_stream() and register the class in ENGINES.
+The default engine runs a quantised Whisper model (faster-whisper, int8),
+splits the audio on silence with VAD and decodes the chunks in parallel
+on all cores.
+"""
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+SAMPLE_RATE = 16000
+
+# Config (can be overridden from .env)
+LOCAL_STT_ENGINE = os.getenv("LOCAL_STT_ENGINE", "whisper")
+LOCAL_STT_MODEL = os.getenv("LOCAL_STT_MODEL", "small")
+LOCAL_STT_COMPUTE_TYPE = os.getenv("LOCAL_STT_COMPUTE_TYPE", "int8")
+LOCAL_STT_WORKERS = int(os.getenv("LOCAL_STT_WORKERS", str(os.cpu_count() or 1)))
+LOCAL_STT_CHUNK_SECONDS = int(os.getenv("LOCAL_STT_CHUNK_SECONDS", "30"))
+
+
+class TranscriptionEngine:
+    """Base class for local transcription engines"""
+    name = "base"
+
+    def transcribe_stream(self, audio_path, language=None):
+        """Yield {"start", "end", "text"} segments in order as they are decoded"""
+        raise NotImplementedError
+
+    def transcribe(self, audio_path, language=None):
+        """Return the full transcript as plain text"""
+        parts = [seg["text"] for seg in self.transcribe_stream(audio_path, language)]
+        return " ".join(p for p in parts if p).strip()
+
+
+# -----------------------------
+# Whisper (faster-whisper) engine
+# -----------------------------
+_worker_model = None
+
+
+def _init_worker(model_size, compute_type):
+    """Load one model per worker process (each worker decodes on a single core)"""
+    global _worker_model
+    from faster_whisper import WhisperModel
+    _worker_model = WhisperModel(model_size, device="cpu", compute_type=compute_type, cpu_threads=1)
+
+
+def _decode_chunk(audio, offset, language):
+    segments, _ = _worker_model.transcribe(audio, language=language, beam_size=1, vad_filter=False)
+    return [
+        {"start": round(offset + s.start, 2), "end": round(offset + s.end, 2), "text": s.text.strip()}
+        for s in segments
+    ]
+
+
+def split_on_speech(audio, max_seconds=LOCAL_STT_CHUNK_SECONDS):
+    """
+    Split audio into chunks of at most max_seconds, cutting only in silence.
+    Returns a list of (start_sample, end_sample).
+    """
+    from faster_whisper.vad import VadOptions, get_speech_timestamps
+
+    speech = get_speech_timestamps(audio, VadOptions(min_silence_duration_ms=500))
+    max_samples = max_seconds * SAMPLE_RATE
+
+    chunks = []
+    for ts in speech:
+        start, end = ts["start"], ts["end"]
+        # Very long speech without pauses: hard split
+        while end - start > max_samples:
+            chunks.append((start, start + max_samples))
+            start += max_samples
+        if chunks and end - chunks[-1][0] <= max_samples:
+            chunks[-1] = (chunks[-1][0], end)  # merge with previous chunk
+        else:
+            chunks.append((start, end))
+    return chunks
+
+
+class WhisperEngine(TranscriptionEngine):
+    name = "whisper"
+
+    def __init__(self, model_size=LOCAL_STT_MODEL, compute_type=LOCAL_STT_COMPUTE_TYPE, workers=LOCAL_STT_WORKERS):
+        self.model_size = model_size
+        self.compute_type = compute_type
+        self.workers = max(1, workers)
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    initializer=_init_worker,
+                    initargs=(self.model_size, self.compute_type),
+                )
+            return self._pool
+
+    def transcribe_stream(self, audio_path, language=None):
+        from faster_whisper.audio import decode_audio
+
+        audio = decode_audio(audio_path, sampling_rate=SAMPLE_RATE)
+        chunks = split_on_speech(audio)
+        pool = self._get_pool()
+
+        futures = [
+            pool.submit(_decode_chunk, audio[start:end], start / SAMPLE_RATE, language)
+            for start, end in chunks
+        ]
+        # Chunks decode in parallel, but are yielded in order
+        for future in futures:
+            for segment in future.result():
+                yield segment
+
+
+ENGINES = {
+    "whisper": WhisperEngine,
+}
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+def get_engine(name=None):
+    """Return a shared engine instance (created on first use)"""
+    name = name or LOCAL_STT_ENGINE
+    if name not in ENGINES:
+        raise ValueError(f"Unknown transcription engine: {name}")
+    with _engines_lock:
+        if name not in _engines:
+            _engines[name] = ENGINES[name]()
+        return _engines[name]
@@ -0,0 +1,239 @@
+"""
+Index manager for many per-user / per-class FAISS indexes.
+
+Indexes are opened lazily on first use, memory-mapped when FAISS supports
+it for the index type (the inverted lists of IVF indexes), and kept in a bounded LRU. Cold indexes are closed
+when there are more than MAX_OPEN_INDEXES open or their in-RAM size
+goes over MAX_INDEX_MEMORY_MB.
+
+    from vector_store import index_manager
+    entry = index_manager.get("faiss_index")
+    entry.index.search(...)
+    index_manager.stats()   # per-index memory accounting
+"""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+INDEX_FILE = "index.faiss"
+MANIFEST_FILE = "manifest.json"
+
+MAX_OPEN_INDEXES = int(os.getenv("MAX_OPEN_INDEXES", "64"))
+MAX_INDEX_MEMORY_MB = int(os.getenv("MAX_INDEX_MEMORY_MB", "2048"))
+INDEX_MMAP = os.getenv("INDEX_MMAP", "1") == "1"
+
+# Index type used for new indexes, see INDEX_TYPES
+DEFAULT_INDEX_TYPE = os.getenv("DEFAULT_INDEX_TYPE", "flat")
+IVF_NLIST = int(os.getenv("IVF_NLIST", "1024"))
+IVF_NPROBE = int(os.getenv("IVF_NPROBE", "16"))
+
+# Memory per vector for d dimensions: flat 4d bytes, sq16 2d, sq8 d, pq d/4
+INDEX_TYPES = {
+    "flat": "exact search, float32 embeddings",
+    "sq16": "float16 embeddings (2x smaller)",
+    "sq8": "int8 embeddings (4x smaller)",
+    "ivf": "inverted file, float32 embeddings (faster search on large indexes)",
+    "pq": "inverted file + product quantisation (16x smaller)",
+}
+
+
+class IndexEntry:
+    """An open index with its manifest and memory accounting"""
+
+    def __init__(self, index_dir, index, manifest, mtime, mmapped, file_bytes, manifest_bytes):
+        self.index_dir = index_dir
+        self.index = index
+        self.manifest = manifest
+        self.tombstones = set(manifest.get("tombstones", []))
+        self.mtime = mtime
+        self.mmapped = mmapped
+        self.file_bytes = file_bytes
+        self.manifest_bytes = manifest_bytes
+        self.opened_at = time.time()
+        self.hits = 0
+
+    @property
+    def heap_bytes(self):
+        """Bytes held in process memory (mmapped vectors are paged by the OS)"""
+        vectors = 0 if self.mmapped else self.file_bytes
+        return vectors + self.manifest_bytes
+
+    def stats(self):
+        return {
+            "index_dir": self.index_dir,
+            "index_type": self.manifest.get("index_type", "flat"),
+            "ntotal": int(self.index.ntotal),
+            "mmapped": self.mmapped,
+            "file_bytes": self.file_bytes,
+            "heap_bytes": self.heap_bytes,
+            "hits": self.hits,
+            "opened_at": self.opened_at,
+        }
+
+
+def read_manifest(index_dir):
+    path = os.path.join(index_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return {"dim": None, "documents": {}, "chunks": {}, "tombstones": []}, 0
+    with open(path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    manifest["chunks"] = {int(k): v for k, v in manifest["chunks"].items()}
+    return manifest, os.path.getsize(path)
+
+
+def _pq_subquantizers(dim):
+    """Largest m <= dim / 4 that divides dim (one byte per sub-vector)"""
+    m = max(1, dim // 4)
+    while dim % m:
+        m -= 1
+    return m
+
+
+def create_index(index_type, vectors):
+    """
+    Create and train an empty index of the given type for these (normalised) vectors.
+    Types that need more training data than we have fall back to a simpler one.
+    Returns (index, actual_index_type).
+    """
+    import faiss
+
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type: {index_type} (choose from {', '.join(INDEX_TYPES)})")
+
+    n, dim = vectors.shape
+    nlist = max(1, min(IVF_NLIST, n // 39))  # FAISS wants ~39 training points per list
+
+    if index_type == "pq" and n < 256:
+        index_type = "sq8"  # PQ needs 256 points to train its codebooks
+    if index_type == "ivf" and nlist < 2:
+        index_type = "flat"
+
+    description = {
+        "flat": "IDMap2,Flat",
+        "sq16": "IDMap2,SQfp16",
+        "sq8": "IDMap2,SQ8",
+        "ivf": f"IVF{nlist},Flat",
+        "pq": f"IVF{nlist},PQ{_pq_subquantizers(dim)}",
+    }[index_type]
+
+    index = faiss.index_factory(dim, description, faiss.METRIC_INNER_PRODUCT)
+    if not index.is_trained:
+        index.train(vectors)
+    return index, index_type
+
+
+def read_index(path, mmap=INDEX_MMAP):
+    """
+    Open an index read-only, memory-mapped if possible. Returns (index, mmapped).
+    FAISS only maps the inverted lists of IVF indexes (ivf, pq); flat / sq8 / sq16
+    codes are read into RAM even with IO_FLAG_MMAP, so those count as not mmapped.
+    """
+    import faiss
+
+    index = None
+    if mmap:
+        try:
+            index = faiss.read_index(path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+        except RuntimeError:
+            pass  # index type cannot be mmapped, load it in RAM
+    if index is None:
+        mmap = False
+        index = faiss.read_index(path)
+
+    try:
+        ivf = faiss.extract_index_ivf(index)
+    except RuntimeError:
+        return index, False  # not an IVF index, fully in RAM
+    ivf.nprobe = IVF_NPROBE
+    return index, mmap
+
+
+class IndexManager:
+    def __init__(self, max_open=MAX_OPEN_INDEXES, max_memory_mb=MAX_INDEX_MEMORY_MB):
+        self.max_open = max_open
+        self.max_memory = max_memory_mb * 1024 * 1024
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._loading = {}  # index_dir -> lock, so an index is only loaded once
+        self.loads = 0
+        self.evictions = 0
+
+    def _load_lock(self, key):
+        with self._lock:
+            return self._loading.setdefault(key, threading.Lock())
+
+    def get(self, index_dir):
+        """Return the IndexEntry for index_dir (loading it if needed), or None if it does not exist"""
+        key = os.path.abspath(index_dir)
+        path = os.path.join(key, INDEX_FILE)
+        try:
+            # Reload if another process rewrote the index or its manifest
+            mtime = os.path.getmtime(path)
+            manifest_path = os.path.join(key, MANIFEST_FILE)
+            if os.path.exists(manifest_path):
+                mtime = max(mtime, os.path.getmtime(manifest_path))
+        except OSError:
+            self.invalidate(key)
+            return None
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.mtime == mtime:
+                self._entries.move_to_end(key)
+                entry.hits += 1
+                return entry
+
+        with self._load_lock(key):
+            # Someone else may have loaded it while we waited
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None and entry.mtime == mtime:
+                    self._entries.move_to_end(key)
+                    entry.hits += 1
+                    return entry
+
+            index, mmapped = read_index(path)
+            manifest, manifest_bytes = read_manifest(key)
+            entry = IndexEntry(key, index, manifest, mtime, mmapped, os.path.getsize(path), manifest_bytes)
+            entry.hits = 1
+
+            with self._lock:
+                self._entries[key] = entry
+                self._entries.move_to_end(key)
+                self.loads += 1
+                self._evict()
+            return entry
+
+    def _evict(self):
+        """Close least recently used indexes until we are within limits (caller holds the lock)"""
+        while len(self._entries) > 1 and (
+            len(self._entries) > self.max_open or self.heap_bytes() > self.max_memory
+        ):
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def heap_bytes(self):
+        return sum(entry.heap_bytes for entry in self._entries.values())
+
+    def invalidate(self, index_dir):
+        """Drop a cached index (call after writing it)"""
+        with self._lock:
+            self._entries.pop(os.path.abspath(index_dir), None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "open_indexes": len(self._entries),
+                "max_open": self.max_open,
+                "heap_bytes": self.heap_bytes(),
+                "max_memory_bytes": self.max_memory,
+                "loads": self.loads,
+                "evictions": self.evictions,
+                "indexes": [entry.stats() for entry in self._entries.values()],
+            }
+
+
+# Shared instance for the AI service
+index_manager = IndexManager()